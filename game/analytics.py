@@ -0,0 +1,190 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# окна статистики: имя -> (число интервалов в кольцевом буфере, секунд в интервале)
+WINDOWS = {
+    '1m': (60, 1),
+    '5m': (60, 5),
+    '1h': (60, 60),
+}
+
+# окно, минутные интервалы которого сохраняются в таблицу trade_bars
+ROLLUP_WINDOW = '1h'
+
+# сколько разных игроков помнит один интервал; дальше unique_traders - оценка снизу
+MAX_TRADERS_PER_BAR = 1024
+
+
+class Bar:
+    """Сделки по одному предмету за один интервал"""
+
+    __slots__ = ('index', 'open', 'high', 'low', 'close', 'volume', 'trades', 'buys', 'turnover', 'traders')
+
+    def __init__(self, index, price):
+        self.index = index
+        self.open = self.high = self.low = self.close = price
+        self.volume = 0
+        self.trades = 0
+        self.buys = 0
+        self.turnover = 0
+        self.traders = set()
+
+
+class RollingWindow:
+    """Кольцевой буфер интервалов: запись O(1), память не растет со временем"""
+
+    __slots__ = ('width', 'bars')
+
+    def __init__(self, size, width):
+        self.width = width
+        self.bars = [None] * size
+
+    def add(self, now, price, quantity, buy, trader):
+        index = int(now // self.width)
+        position = index % len(self.bars)
+        bar = self.bars[position]
+        # интервал в этой ячейке устарел - переиспользуем ее
+        if bar is None or bar.index != index:
+            bar = self.bars[position] = Bar(index, price)
+
+        if price > bar.high:
+            bar.high = price
+        if price < bar.low:
+            bar.low = price
+        bar.close = price
+        bar.volume += quantity
+        bar.trades += 1
+        bar.buys += buy
+        bar.turnover += price * quantity
+        if len(bar.traders) < MAX_TRADERS_PER_BAR:
+            bar.traders.add(trader)
+
+    def current(self, now):
+        """Интервалы, попадающие в окно, по возрастанию времени"""
+        oldest = int(now // self.width) - len(self.bars)
+        return sorted((bar for bar in self.bars if bar is not None and bar.index > oldest),
+                      key=lambda bar: bar.index)
+
+    def summary(self, now):
+        bars = self.current(now)
+        if not bars:
+            return None
+
+        traders = set()
+        for bar in bars:
+            traders |= bar.traders
+
+        trades = sum(bar.trades for bar in bars)
+        buys = sum(bar.buys for bar in bars)
+        return {
+            'open': bars[0].open,
+            'high': max(bar.high for bar in bars),
+            'low': min(bar.low for bar in bars),
+            'close': bars[-1].close,
+            'volume': sum(bar.volume for bar in bars),
+            'trades': trades,
+            'buys': buys,
+            'sells': trades - buys,
+            'turnover': sum(bar.turnover for bar in bars),
+            'unique_traders': len(traders)
+        }
+
+
+class TradeAnalytics:
+    """Скользящая статистика сделок по предметам: OHLC, объем, число игроков"""
+
+    def __init__(self, windows=WINDOWS):
+        self.windows = windows
+        self.lock = threading.Lock()
+        # ключ предмета -> {окно: RollingWindow}
+        self.items = {}
+        # ключ предмета -> id в таблице items, для сохранения в БД
+        self.item_ids = {}
+
+    def record(self, item, price, buy, trader, quantity=1, now=None):
+        """Учет одной сделки: по одному интервалу в каждом окне"""
+        now = time.time() if now is None else now
+        with self.lock:
+            windows = self.items.get(item.key)
+            if windows is None:
+                windows = self.items[item.key] = {
+                    name: RollingWindow(size, width) for name, (size, width) in self.windows.items()
+                }
+            self.item_ids[item.key] = item.id
+
+            for window in windows.values():
+                window.add(now, price, quantity, buy, trader)
+
+    def stats(self, window, item_key=None, now=None):
+        """{ключ предмета: сводка} за окно по предметам, у которых были сделки"""
+        now = time.time() if now is None else now
+        with self.lock:
+            keys = [item_key] if item_key is not None else list(self.items)
+            result = {}
+            for key in keys:
+                windows = self.items.get(key)
+                summary = windows[window].summary(now) if windows else None
+                if summary is not None:
+                    result[key] = summary
+        return result
+
+    def rollup_rows(self, since_index, node, now=None):
+        """Строки для trade_bars: интервалы окна ROLLUP_WINDOW с индексом не меньше since_index"""
+        now = time.time() if now is None else now
+        rows = []
+        with self.lock:
+            for key, windows in self.items.items():
+                window = windows[ROLLUP_WINDOW]
+                for bar in window.current(now):
+                    if bar.index < since_index:
+                        continue
+                    period_start = datetime.fromtimestamp(bar.index * window.width).isoformat()
+                    rows.append((self.item_ids[key], period_start, node, bar.open, bar.high, bar.low, bar.close,
+                                 bar.volume, bar.trades, bar.buys, bar.turnover, len(bar.traders)))
+        return rows
+
+
+class TradeRollup:
+    """Периодическое сохранение минутных интервалов в SQLite
+
+    Текущий, еще не закрытый интервал тоже сохраняется и перезаписывается
+    при следующем проходе. Каждый сервер пишет свои строки (node), общий
+    итог по рынку - сумма по серверам.
+    """
+
+    def __init__(self, analytics, db_manager, interval, node=''):
+        self.analytics = analytics
+        self.node = node
+        self.db_manager = db_manager
+        self.interval = interval
+        self.width = analytics.windows[ROLLUP_WINDOW][1]
+        self.since_index = 0
+        self.stopped = threading.Event()
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка сохранения статистики сделок: {e}")
+
+    def flush(self):
+        now = time.time()
+        rows = self.analytics.rollup_rows(self.since_index, self.node, now)
+        if rows:
+            self.db_manager.save_trade_bars(rows)
+        # незакрытый интервал перезапишем в следующий раз
+        self.since_index = int(now // self.width)
+        return len(rows)
@@ -0,0 +1,272 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import socket
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import timeit
+from datetime import datetime
+
+from server import GameConfig, GameServer
+
+# порог регрессии по умолчанию: медиана выросла больше чем на 20%
+DEFAULT_THRESHOLD = 0.2
+
+BENCH_NICKNAME = 'bench_player'
+
+
+class BenchmarkSuite:
+    """Набор бенчмарков: БД, обработка запросов, JSON и сквозной обмен через сокет
+
+    Все бенчмарки работают на временной базе и локальном сервере, сеть не нужна.
+    """
+
+    def __init__(self, repeat=5, min_time=0.2):
+        self.repeat = repeat
+        self.min_time = min_time
+        self.results = {}
+
+    def measure(self, name, func):
+        """Время одного вызова func в микросекундах: медиана и минимум по повторам"""
+        timer = timeit.Timer(func)
+        number, _ = timer.autorange()
+        # autorange подбирает число вызовов на ~0.2 с, при необходимости масштабируем
+        number = max(1, int(number * self.min_time / 0.2))
+
+        runs = [elapsed / number * 1e6 for elapsed in timer.repeat(self.repeat, number)]
+        self.results[name] = {
+            'median_us': round(statistics.median(runs), 3),
+            'min_us': round(min(runs), 3),
+            'number': number,
+            'repeat': self.repeat
+        }
+        print(f"{name.ljust(36)} {self.results[name]['median_us']:>12.1f} мкс")
+
+    def run(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            server = GameServer(port=0, db_path=os.path.join(tmp, 'bench.db'))
+            self.prepare(server)
+
+            self.bench_database(server.db_manager)
+            self.bench_dispatch(server)
+            self.bench_json(server)
+            self.bench_analytics(server)
+            self.bench_roundtrip(server)
+
+        return self.results
+
+    def prepare(self, server):
+        """Игрок с большим балансом и запасом предметов, чтобы сделки не упирались в остатки"""
+        server.process_request({'action': 'login', 'nickname': BENCH_NICKNAME})
+        for item_id in ('rope', 'potion', 'sword', 'ship', 'compass'):
+            server.process_request({'action': 'buy_item', 'nickname': BENCH_NICKNAME, 'item_id': item_id})
+
+        account = server.active_sessions[BENCH_NICKNAME]
+        conn = sqlite3.connect(server.db_manager.db_path)
+        with conn:
+            conn.execute('UPDATE accounts SET credits = ? WHERE id = ?', (10 ** 12, account['id']))
+            conn.execute('UPDATE player_items SET quantity = ? WHERE account_id = ?', (10 ** 9, account['id']))
+        conn.close()
+        # сессия заново из БД, с запасами
+        server.process_request({'action': 'logout', 'nickname': BENCH_NICKNAME})
+        server.process_request({'action': 'login', 'nickname': BENCH_NICKNAME})
+
+        # еще немного аккаунтов для массовых операций
+        for i in range(1000):
+            server.db_manager.create_account(f'bench_{i}')
+
+    def bench_database(self, db_manager):
+        account = db_manager.get_account(BENCH_NICKNAME)
+        account_id = account['id']
+        item_id = db_manager.load_items()[0][0]
+        counter = itertools.count()
+
+        self.measure('db.get_account', lambda: db_manager.get_account(BENCH_NICKNAME))
+        self.measure('db.create_account', lambda: db_manager.create_account(f'new_{next(counter)}'))
+        self.measure('db.add_credits', lambda: db_manager.add_credits(account_id, 0))
+        self.measure('db.trade', lambda: db_manager.trade(account_id, item_id, 0, 1))
+        self.measure('db.load_items', db_manager.load_items)
+
+    def bench_dispatch(self, server):
+        """process_request для каждого действия
+
+        profile_start/profile_stop/memory_snapshot не измеряются: они
+        переключают глобальное состояние процесса (cProfile, tracemalloc).
+        """
+        token = GameConfig.ADMIN_TOKEN
+
+        def request(**fields):
+            return lambda: server.process_request(fields)
+
+        requests = {
+            'login': request(action='login', nickname=BENCH_NICKNAME),
+            'get_items': request(action='get_items'),
+            'buy_item': request(action='buy_item', nickname=BENCH_NICKNAME, item_id='rope'),
+            'sell_item': request(action='sell_item', nickname=BENCH_NICKNAME, item_id='potion'),
+            # повтор с тем же request_id: сохраненный ответ вместо сделки
+            'buy_item_replay': request(action='buy_item', nickname=BENCH_NICKNAME, item_id='rope',
+                                       request_id='bench_replay'),
+            'get_account_info': request(action='get_account_info', nickname=BENCH_NICKNAME),
+            'get_inventory': request(action='get_inventory', nickname=BENCH_NICKNAME,
+                                     sort='value', order='desc', limit=20),
+            'health': request(action='health'),
+            'get_trade_stats': request(action='get_trade_stats', window='1h'),
+            'reload_items': request(action='reload_items', admin_token=token),
+            'attach_session': request(action='attach_session', admin_token=token, nickname='bench_0'),
+            'grant_bonus': request(action='grant_bonus', admin_token=token, credits=1),
+            'get_stage_timings': request(action='get_stage_timings', admin_token=token),
+            'unknown_action': request(action='no_such_action'),
+        }
+
+        for action, func in requests.items():
+            self.measure(f'dispatch.{action}', func)
+
+        # выход измеряется на одной и той же сессии, которая каждый раз возвращается
+        account = server.active_sessions[BENCH_NICKNAME]
+
+        def logout():
+            server.active_sessions[BENCH_NICKNAME] = account
+            server.process_request({'action': 'logout', 'nickname': BENCH_NICKNAME})
+
+        self.measure('dispatch.logout', logout)
+        server.active_sessions[BENCH_NICKNAME] = account
+
+    def bench_json(self, server):
+        """Кодирование и разбор типичных ответов"""
+        responses = {
+            'login': server.process_request({'action': 'login', 'nickname': 'bench_json'}),
+            'get_items': server.process_request({'action': 'get_items'}),
+            'buy_item': server.process_request({'action': 'buy_item', 'nickname': BENCH_NICKNAME,
+                                                'item_id': 'rope'}),
+            'get_inventory': server.process_request({'action': 'get_inventory',
+                                                     'nickname': BENCH_NICKNAME}),
+        }
+
+        for name, response in responses.items():
+            encoded = json.dumps(response, ensure_ascii=False).encode('utf-8')
+            self.measure(f'json.encode.{name}',
+                         lambda response=response: json.dumps(response, ensure_ascii=False).encode('utf-8'))
+            self.measure(f'json.decode.{name}', lambda encoded=encoded: json.loads(encoded.decode('utf-8')))
+
+    def bench_analytics(self, server):
+        """Учет сделки в скользящих окнах статистики"""
+        item = server.catalog.get('rope')
+        trader = itertools.count()
+        self.measure('analytics.record', lambda: server.analytics.record(item, item.price, True, next(trader)))
+
+    def bench_roundtrip(self, server):
+        """Сквозной обмен запрос-ответ с сервером через loopback"""
+        threading.Thread(target=server.start, daemon=True).start()
+        deadline = time.monotonic() + 10
+        while not server.ready and time.monotonic() < deadline:
+            time.sleep(0.001)
+
+        conn = socket.create_connection((server.host, server.port))
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def call(payload):
+            conn.sendall(payload)
+            return conn.recv(65536)
+
+        for name, request in (
+            ('get_account_info', {'action': 'get_account_info', 'nickname': BENCH_NICKNAME}),
+            ('buy_item', {'action': 'buy_item', 'nickname': BENCH_NICKNAME, 'item_id': 'rope'}),
+        ):
+            payload = json.dumps(request).encode('utf-8')
+            self.measure(f'roundtrip.{name}', lambda payload=payload: call(payload))
+
+        conn.close()
+
+
+def save_results(results, path):
+    """Сохранение результатов с описанием окружения"""
+    data = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine()
+        },
+        'results': results
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['results']
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """Сравнение медиан, возвращает список регрессий"""
+    regressions = []
+    print(f"{'бенчмарк'.ljust(36)} {'база, мкс':>12} {'сейчас, мкс':>12} {'изменение':>10}")
+
+    for name in sorted(set(baseline) | set(current)):
+        if name not in baseline or name not in current:
+            status = 'новый' if name in current else 'пропал'
+            print(f"{name.ljust(36)} {status:>12}")
+            continue
+
+        old, new = baseline[name]['median_us'], current[name]['median_us']
+        change = (new - old) / old if old else 0
+        flag = ''
+        if change > threshold:
+            flag = '  РЕГРЕССИЯ'
+            regressions.append(name)
+        print(f"{name.ljust(36)} {old:>12.1f} {new:>12.1f} {change:>+9.1%}{flag}")
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарки игрового сервера')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='запустить бенчмарки')
+    run_parser.add_argument('--out', default='benchmark_results.json', help='куда сохранить результаты')
+    run_parser.add_argument('--repeat', type=int, default=5)
+    run_parser.add_argument('--min-time', type=float, default=0.2, help='секунд на один повтор')
+    run_parser.add_argument('--compare', metavar='BASELINE', help='сравнить с базовыми результатами')
+    run_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+
+    compare_parser = subparsers.add_parser('compare', help='сравнить два файла результатов')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        # логирование каждого запроса замерялось бы вместе с выводом в консоль
+        logging.getLogger().setLevel(logging.WARNING)
+        GameConfig.ADMIN_TOKEN = GameConfig.ADMIN_TOKEN or 'benchmark'
+
+        results = BenchmarkSuite(args.repeat, args.min_time).run()
+        save_results(results, args.out)
+        print(f"\nРезультаты сохранены в {args.out}")
+
+        if not args.compare:
+            return
+        baseline, current = load_results(args.compare), results
+    else:
+        baseline, current = load_results(args.baseline), load_results(args.current)
+
+    print()
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"\nРегрессии больше {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print("\nРегрессий нет")
+
+
+if __name__ == '__main__':
+    main()
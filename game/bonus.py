@@ -0,0 +1,275 @@
+import argparse
+import contextlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from catalog import Item, ItemCatalog
+
+logger = logging.getLogger(__name__)
+
+# аккаунтов в одной транзакции: короткие транзакции не задерживают торговлю
+CHUNK_SIZE = 10000
+
+# пауза между транзакциями, чтобы ожидающие сделки успели взять блокировку
+CHUNK_PAUSE = 0.002
+
+# фильтры сегмента: параметр -> (условие на таблицу accounts, тип значения)
+SEGMENT_FILTERS = {
+    'min_credits': ('credits >= ?', int),
+    'max_credits': ('credits <= ?', int),
+    'active_since': ('last_login >= ?', str),
+}
+
+
+def segment_clause(segment):
+    """SQL-условие и параметры для сегмента аккаунтов"""
+    segment = segment or {}
+    unknown = set(segment) - set(SEGMENT_FILTERS)
+    if unknown:
+        raise ValueError(f'Неизвестные фильтры сегмента: {", ".join(sorted(unknown))}')
+
+    for name, value in segment.items():
+        value_type = SEGMENT_FILTERS[name][1]
+        # SQLite сравнивает строку с числом без ошибки, и сегмент молча оказался бы пустым
+        if not isinstance(value, value_type) or isinstance(value, bool):
+            raise ValueError(f'Неверное значение фильтра сегмента {name}')
+
+    conditions = [SEGMENT_FILTERS[name][0] for name in segment]
+    params = [segment[name] for name in segment]
+    return ''.join(f' AND {condition}' for condition in conditions), params
+
+
+def grant_chunk(conn, first_id, last_id, where, params, credits, item, quantity, session_ids):
+    """Начисление бонуса аккаунтам с id в (first_id, last_id], возвращает задетые сессии"""
+    range_params = [first_id, last_id, *params]
+    accounts = f'SELECT id FROM accounts WHERE id > ? AND id <= ?{where}'
+
+    # какие открытые сессии попадают в сегмент, по состоянию до начисления
+    affected = []
+    if session_ids:
+        placeholders = ', '.join('?' * len(session_ids))
+        affected = [row[0] for row in conn.execute(
+            f'{accounts} AND id IN ({placeholders})', [*range_params, *session_ids])]
+
+    # предметы раньше кредитов: фильтр по кредитам должен видеть старые значения
+    if item is not None:
+        conn.execute(f'''
+            UPDATE player_items SET quantity = quantity + ?
+            WHERE item_id = ? AND account_id IN ({accounts})
+        ''', [quantity, item.id, *range_params])
+        conn.execute(f'''
+            INSERT INTO player_items (account_id, item_id, quantity)
+            SELECT a.id, ?, ? FROM ({accounts}) a
+            WHERE NOT EXISTS (
+                SELECT 1 FROM player_items p WHERE p.account_id = a.id AND p.item_id = ?
+            )
+        ''', [item.id, quantity, *range_params, item.id])
+
+    if credits:
+        cursor = conn.execute(f'''
+            UPDATE accounts SET credits = credits + ?
+            WHERE id > ? AND id <= ?{where}
+        ''', [credits, *range_params])
+        granted = cursor.rowcount
+    else:
+        granted = conn.execute(f'SELECT COUNT(*) FROM ({accounts})', range_params).fetchone()[0]
+
+    return granted, affected
+
+
+def grant_bonus(db_manager, credits=0, item=None, quantity=1, segment=None,
+                chunk_size=CHUNK_SIZE, sessions=None, lock=None):
+    """Начисление кредитов и/или предмета всем аккаунтам сегмента
+
+    Аккаунты обрабатываются диапазонами id по chunk_size, каждый диапазон -
+    одна транзакция из нескольких UPDATE/INSERT ... SELECT. Если переданы
+    открытые сессии сервера, они исправляются под той же блокировкой,
+    что и сделки, сразу после фиксации диапазона.
+    """
+    if not credits and item is None:
+        raise ValueError('Нечего начислять')
+    if credits < 0 or quantity <= 0:
+        raise ValueError('Начисление должно быть положительным')
+
+    where, params = segment_clause(segment)
+    lock = lock or contextlib.nullcontext()
+    started = time.perf_counter()
+    total = 0
+    chunks = 0
+
+    conn = sqlite3.connect(db_manager.db_path, isolation_level=None, timeout=30)
+    try:
+        max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM accounts').fetchone()[0]
+
+        for first_id in range(0, max_id, chunk_size):
+            last_id = first_id + chunk_size
+
+            with lock:
+                session_by_id = {}
+                if sessions:
+                    session_by_id = {account['id']: account for account in sessions.values()
+                                     if first_id < account['id'] <= last_id}
+
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    granted, affected = grant_chunk(conn, first_id, last_id, where, params,
+                                                    credits, item, quantity, list(session_by_id))
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+
+                for account_id in affected:
+                    account = session_by_id[account_id]
+                    account['credits'] += credits
+                    if item is not None:
+                        account['items'][item.key] = account['items'].get(item.key, 0) + quantity
+                        account['inventory_value'] += item.price * quantity
+
+            total += granted
+            chunks += 1
+            time.sleep(CHUNK_PAUSE)
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Бонус начислен: аккаунтов {total}, транзакций {chunks}, {elapsed:.2f} с")
+    return {'accounts': total, 'chunks': chunks, 'seconds': round(elapsed, 3)}
+
+
+class BonusScheduler:
+    """Периодическое начисление бонуса (ежедневные и событийные награды)
+
+    Время последнего начисления хранится в БД, расписание отсчитывается от
+    него: перезапуск сервера не сдвигает и не пропускает начисления.
+    """
+
+    def __init__(self, server, interval, credits=0, item_id=None, quantity=1, segment=None,
+                 name='scheduled_bonus'):
+        self.server = server
+        self.name = name
+        self.interval = interval
+        self.credits = credits
+        self.item_id = item_id
+        self.quantity = quantity
+        self.segment = segment
+        self.stopped = threading.Event()
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        db_manager = self.server.db_manager
+        while True:
+            last_run = db_manager.get_last_grant(self.name)
+            # никогда не начисляли - начисляем сразу
+            delay = 0 if last_run is None else max(0, last_run + self.interval - time.time())
+            if self.stopped.wait(delay):
+                return
+
+            try:
+                self.server.grant_bonus(self.credits, self.item_id, self.quantity, self.segment)
+                db_manager.set_last_grant(self.name, time.time())
+            except Exception as e:
+                logger.error(f"Ошибка начисления бонуса по расписанию: {e}")
+                # повтор не раньше чем через интервал, а не в цикле без паузы
+                if self.stopped.wait(self.interval):
+                    return
+
+
+def run_benchmark(accounts, credits=100, item_key='potion', trade_threads=2):
+    """Бенчмарк: бонус на accounts аккаунтов при параллельной торговле"""
+    from server import DatabaseManager
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_manager = DatabaseManager(os.path.join(tmp, 'bench.db'))
+
+        conn = sqlite3.connect(db_manager.db_path)
+        with conn:
+            conn.executemany(
+                'INSERT INTO accounts (id, nickname, credits, last_login) VALUES (?, ?, ?, ?)',
+                ((i, f'player_{i}', random.randint(0, 1000), '2024-01-01') for i in range(1, accounts + 1)))
+            conn.executemany(
+                'INSERT INTO items (key, name, price) VALUES (?, ?, ?)',
+                [(key, key, 10) for key in (item_key, 'rope')])
+        items = {key: item_id for item_id, key in conn.execute('SELECT id, key FROM items')}
+        conn.close()
+
+        item = Item(items[item_key], item_key, item_key, 10)
+
+        # торговля во время начисления под той же блокировкой, что и на сервере
+        lock = threading.RLock()
+        stop = threading.Event()
+        trade_times = []
+
+        def trade():
+            while not stop.is_set():
+                account_id = random.randint(1, accounts)
+                t = time.perf_counter()
+                with lock:
+                    db_manager.trade(account_id, items['rope'], 0, 1)
+                trade_times.append(time.perf_counter() - t)
+
+        traders = [threading.Thread(target=trade) for _ in range(trade_threads)]
+        for thread in traders:
+            thread.start()
+
+        result = grant_bonus(db_manager, credits, item, sessions={}, lock=lock)
+
+        stop.set()
+        for thread in traders:
+            thread.join()
+
+    trade_times.sort()
+    result.update({
+        'trades_during_job': len(trade_times),
+        'trade_p50_ms': round(trade_times[len(trade_times) // 2] * 1000, 2) if trade_times else None,
+        'trade_max_ms': round(trade_times[-1] * 1000, 2) if trade_times else None,
+    })
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Начисление бонуса всем аккаунтам. При работающем сервере используйте '
+                    'действие grant_bonus, иначе открытые сессии перезапишут начисление.')
+    parser.add_argument('--db', default='game_database.db', help='путь к базе данных')
+    parser.add_argument('--credits', type=int, default=0)
+    parser.add_argument('--item', help='ключ предмета из каталога')
+    parser.add_argument('--quantity', type=int, default=1)
+    parser.add_argument('--segment', type=json.loads, default=None,
+                        help='фильтр, например \'{"min_credits": 100}\'')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--bench', type=int, metavar='N', help='бенчмарк на N аккаунтах')
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        print(json.dumps(run_benchmark(args.bench)))
+        return
+
+    from server import DatabaseManager
+
+    db_manager = DatabaseManager(args.db)
+    item = None
+    if args.item:
+        item = ItemCatalog(db_manager.load_items()).get(args.item)
+        if item is None:
+            parser.error(f'неизвестный предмет {args.item}')
+
+    print(json.dumps(grant_bonus(db_manager, args.credits, item, args.quantity,
+                                 args.segment, args.chunk_size)))
+
+
+if __name__ == '__main__':
+    main()
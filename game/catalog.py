@@ -0,0 +1,78 @@
+import json
+from collections import namedtuple
+from types import MappingProxyType
+
+# предмет каталога: id - компактный числовой идентификатор из таблицы items
+Item = namedtuple('Item', ('id', 'key', 'name', 'price'))
+
+
+class CatalogError(ValueError):
+    """Ошибка в файле каталога предметов"""
+
+
+def load_catalog_file(path):
+    """Чтение и проверка файла каталога, возвращает список словарей предметов"""
+    with open(path, encoding='utf-8') as f:
+        try:
+            items = json.load(f)
+        except json.JSONDecodeError as e:
+            raise CatalogError(f'Неверный формат JSON: {e}')
+
+    if not isinstance(items, list):
+        raise CatalogError('Каталог должен быть списком предметов')
+
+    seen = set()
+    for item in items:
+        if not isinstance(item, dict):
+            raise CatalogError('Предмет должен быть объектом')
+
+        key, name, price = item.get('key'), item.get('name'), item.get('price')
+        if not isinstance(key, str) or not key:
+            raise CatalogError(f'Неверный ключ предмета: {key!r}')
+        if key in seen:
+            raise CatalogError(f'Повторяющийся ключ предмета: {key}')
+        if not isinstance(name, str) or not name:
+            raise CatalogError(f'Неверное название предмета {key}')
+        if not isinstance(price, int) or isinstance(price, bool) or price < 0:
+            raise CatalogError(f'Неверная цена предмета {key}')
+        seen.add(key)
+
+    return items
+
+
+class ItemCatalog:
+    """Неизменяемый снимок каталога предметов
+
+    При перезагрузке каталога сервер создает новый снимок и заменяет ссылку на него,
+    поэтому запрос, взявший снимок в начале обработки, видит его целиком.
+    """
+
+    __slots__ = ('version', 'by_key', 'by_id', 'public')
+
+    def __init__(self, rows, version=1):
+        by_key = {}
+        by_id = {}
+
+        for item_id, key, name, price, active in rows:
+            item = Item(item_id, key, name, price)
+            # снятые с продажи предметы остаются в by_id для старых инвентарей
+            by_id[item_id] = item
+            if active:
+                by_key[key] = item
+
+        self.version = version
+        self.by_key = MappingProxyType(by_key)
+        self.by_id = MappingProxyType(by_id)
+        # готовый ответ клиенту в прежнем формате {ключ: {name, price}}, не изменять
+        self.public = {item.key: {'name': item.name, 'price': item.price}
+                       for item in by_key.values()}
+
+    def __contains__(self, key):
+        return key in self.by_key
+
+    def __len__(self):
+        return len(self.by_key)
+
+    def get(self, key):
+        """Активный предмет по ключу или None"""
+        return self.by_key.get(key)
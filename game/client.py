@@ -2,14 +2,23 @@ import socket
 import json
 import os
 import time
+import uuid
+
+from startup import new_ready_file, start_server_process, wait_until_ready
 
 
 class GameClient:
     """Основной класс игрового клиента"""
 
-    def __init__(self, host='localhost', port=12345):
+    # сколько раз повторить покупку, продажу или вход после таймаута ответа
+    MUTATION_RETRIES = 3
+    # пауза перед повтором, если сервер ответил retry, секунд
+    RETRY_DELAY = 0.05
+
+    def __init__(self, host='localhost', port=12345, timeout=5):
         self.host = host
         self.port = port
+        self.timeout = timeout
         self.socket = None
         self.connected = False
         self.current_account = None
@@ -20,7 +29,7 @@ class GameClient:
         """Подключение к серверу"""
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.settimeout(5)
+            self.socket.settimeout(self.timeout)
             self.socket.connect((self.host, self.port))
             self.connected = True
             print(f"Подключено к серверу {self.host}:{self.port}")
@@ -45,12 +54,58 @@ class GameClient:
             self.connected = False
             print("Отключено от сервера")
 
-    def send_request(self, request):
-        """Отправка запроса на сервер"""
+    def reconnect(self):
+        """Новое соединение: опоздавший ответ придет в старое и не спутается со следующим"""
+        self.socket.close()
+        self.connected = False
+        return self.connect()
+
+    def send_request(self, request, retries=0):
+        """Отправка запроса на сервер
+
+        После любого таймаута соединение пересоздается. Запрос повторяется до
+        retries раз; повторять можно только запросы с request_id, сервер не
+        выполнит их дважды. С request_id повтор идет и после разрыва
+        соединения, и после ответа сервера с retry.
+        """
         if not self.connected:
             print("Не подключен к серверу")
             return None
 
+        retry_safe = 'request_id' in request
+        response = None
+        for attempt in range(retries + 1):
+            if attempt:
+                print(f"Повтор запроса ({attempt}/{retries})")
+
+            try:
+                response = self.exchange(request)
+            except socket.timeout:
+                print("Таймаут ответа от сервера")
+                if not self.reconnect():
+                    return None
+                continue
+
+            if not retry_safe:
+                return response
+            if response is None and not self.connected:
+                # соединение разорвано: ответа нет, но сервер мог выполнить запрос
+                if not self.reconnect():
+                    return None
+            elif response is not None and response.get('retry'):
+                time.sleep(self.RETRY_DELAY)
+            else:
+                return response
+
+        return response
+
+    def send_mutation(self, request):
+        """Отправка изменяющего запроса с request_id и повторами после таймаута"""
+        request = dict(request, request_id=uuid.uuid4().hex)
+        return self.send_request(request, retries=self.MUTATION_RETRIES)
+
+    def exchange(self, request):
+        """Один обмен запрос-ответ, таймаут передается вызывающему"""
         try:
             # отправляем запрос
             request_data = json.dumps(request, ensure_ascii=False)
@@ -72,8 +127,7 @@ class GameClient:
             self.connected = False
             return None
         except socket.timeout:
-            print("Таймаут ответа от сервера")
-            return None
+            raise
         except json.JSONDecodeError:
             print("Ошибка декодирования ответа от сервера")
             return None
@@ -116,7 +170,7 @@ class GameClient:
         print("\nПодключение к серверу")
 
         # отправляем запрос на логин
-        response = self.send_request({
+        response = self.send_mutation({
             'action': 'login',
             'nickname': nickname
         })
@@ -183,6 +237,7 @@ class GameClient:
         if response and response.get('status') == 'success':
             account = response['account']
             print(f"Баланс игрока {account['nickname']}: {account['credits']} кредитов")
+            print(f"Стоимость предметов: {account['inventory_value']} кредитов")
         else:
             print("Ошибка получения баланса")
 
@@ -209,12 +264,35 @@ class GameClient:
         print("Ваши предметы:")
         print("-" * 50)
 
-        if not self.current_account['items']:
-            print("У вас нет предметов")
-        else:
-            for item_id, quantity in self.current_account['items'].items():
-                item_name = self.available_items.get(item_id, {}).get('name', 'Неизвестный предмет')
-                print(f"{item_id.ljust(15)} | {item_name.ljust(20)} | Количество: {quantity}")
+        # инвентарь постранично, самые ценные предметы первыми; стоимость считает сервер
+        cursor = None
+        while True:
+            response = self.send_request({
+                'action': 'get_inventory',
+                'nickname': self.current_account['nickname'],
+                'sort': 'value',
+                'order': 'desc',
+                'cursor': cursor
+            })
+
+            if not response or response.get('status') != 'success':
+                print("Ошибка получения предметов")
+                break
+
+            if not response['items'] and cursor is None:
+                print("У вас нет предметов")
+
+            for item in response['items']:
+                print(f"{item['item_id'].ljust(15)} | {item['name'].ljust(20)} | "
+                      f"Количество: {item['quantity']} | Стоимость: {item['value']}")
+
+            cursor = response['next_cursor']
+            if not cursor:
+                print(f"\nОбщая стоимость предметов: {response['inventory_value']} кредитов")
+                break
+
+            if input("\nEnter - следующая страница, 'q' - выход: ").strip().lower() == 'q':
+                break
 
         input("\nНажмите Enter для продолжения...")
 
@@ -242,7 +320,7 @@ class GameClient:
             return
 
         # Отправляем запрос на покупку
-        response = self.send_request({
+        response = self.send_mutation({
             'action': 'buy_item',
             'nickname': self.current_account['nickname'],
             'item_id': item_id
@@ -250,8 +328,7 @@ class GameClient:
 
         if response and response.get('status') == 'success':
             print(f"\n{response['message']}")
-            self.current_account['credits'] = response['new_credits']
-            self.current_account['items'] = response['items']
+            self.apply_trade(response)
             print(f"Текущий баланс: {self.current_account['credits']} кредитов")
         else:
             error_msg = response.get('message', 'Неизвестная ошибка') if response else 'Ошибка соединения'
@@ -290,7 +367,7 @@ class GameClient:
             return
 
         # Отправляем запрос на продажу
-        response = self.send_request({
+        response = self.send_mutation({
             'action': 'sell_item',
             'nickname': self.current_account['nickname'],
             'item_id': item_id
@@ -298,8 +375,7 @@ class GameClient:
 
         if response and response.get('status') == 'success':
             print(f"\n{response['message']}")
-            self.current_account['credits'] = response['new_credits']
-            self.current_account['items'] = response['items']
+            self.apply_trade(response)
             print(f"Текущий баланс: {self.current_account['credits']} кредитов")
         else:
             error_msg = response.get('message', 'Неизвестная ошибка') if response else 'Ошибка соединения'
@@ -307,6 +383,16 @@ class GameClient:
 
         input("Нажмите Enter для продолжения")
 
+    def apply_trade(self, response):
+        """Применение изменений из ответа на покупку или продажу"""
+        self.current_account['credits'] = response['new_credits']
+        self.current_account['inventory_value'] = response['inventory_value']
+
+        if response['quantity'] > 0:
+            self.current_account['items'][response['item_id']] = response['quantity']
+        else:
+            self.current_account['items'].pop(response['item_id'], None)
+
     def logout(self):
         """Выход из игры"""
         self.send_request({
@@ -324,44 +410,45 @@ class GameClient:
         """Ожидание запуска сервера"""
         print("Проверка доступности сервера...")
 
+        # короткие паузы с удвоением: обычно сервер готов сразу после сигнала
+        delay = 0.05
         for attempt in range(max_attempts):
             if self.connect():
                 return True
 
             if attempt == 0:
                 print("Сервер недоступен. Попытка автоматического запуска")
-                self.try_start_server()
+                if self.try_start_server():
+                    continue
 
             print(f"Попытка подключения {attempt + 1}/{max_attempts}")
-            time.sleep(2)
+            time.sleep(delay)
+            delay = min(delay * 2, 1)
 
         return False
 
     def try_start_server(self):
-        """Попытка автоматического запуска сервера"""
-        import subprocess
-        import sys
-        import os
-
+        """Попытка автоматического запуска сервера, True - сервер сообщил о готовности"""
         # Проверяем, есть ли файл server.py
         if os.path.exists('server.py'):
             try:
                 print("Запуск сервера...")
-                # Запускаем сервер в отдельном процессе
-                if os.name == 'nt':  # Windows
-                    subprocess.Popen([sys.executable, 'server.py'],
-                                     creationflags=subprocess.CREATE_NEW_CONSOLE)
-                else:  # Linux/Mac
-                    subprocess.Popen([sys.executable, 'server.py'])
+                # Запускаем сервер в отдельном процессе и ждем его сигнала готовности
+                ready_file = new_ready_file()
+                process = start_server_process('server.py', ready_file=ready_file)
 
                 print("Сервер запущен. Ожидание инициализации")
-                time.sleep(3)  # Даем время серверу запуститься
+                if wait_until_ready(ready_file, process):
+                    return True
+                print("Сервер не сообщил о готовности")
 
             except Exception as e:
                 print(f"Не удалось автоматически запустить сервер {e}")
         else:
             print("Файл server.py не найден в текущей директории")
 
+        return False
+
     def run(self):
         """Основной цикл клиента"""
         print("Запуск игрового клиента...")
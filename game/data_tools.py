@@ -0,0 +1,264 @@
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+import time
+from itertools import islice
+
+from server import DatabaseManager
+
+
+# выгружаемые таблицы и их колонки (порядок колонок = порядок в CSV).
+# Предметы игроков выгружаются с ключом предмета, а не с id: id предметов в
+# разных базах назначаются по-своему.
+TABLES = {
+    'accounts': ('id', 'nickname', 'credits', 'last_login', 'created_at'),
+    'items': ('id', 'key', 'name', 'price', 'active'),
+    'player_items': ('id', 'account_id', 'item_key', 'quantity'),
+}
+
+# запросы выгрузки: выборка колонок и колонка id для keyset-пагинации
+EXPORT_QUERIES = {
+    'accounts': ('SELECT id, nickname, credits, last_login, created_at FROM accounts', 'id'),
+    'items': ('SELECT id, key, name, price, active FROM items', 'id'),
+    'player_items': ('SELECT p.id, p.account_id, i.key, p.quantity FROM player_items p '
+                     'JOIN items i ON i.id = p.item_id', 'p.id'),
+}
+
+# колонки с целыми числами: значения из CSV и NDJSON проверяются до записи в БД
+INTEGER_COLUMNS = {'id', 'account_id', 'item_id', 'credits', 'price', 'active', 'quantity'}
+
+EXPORT_BATCH_SIZE = 5000
+IMPORT_BATCH_SIZE = 10000
+
+# сколько пачек импорта помещается в одну транзакцию
+BATCHES_PER_TRANSACTION = 50
+
+
+def iter_rows(conn, table, batch_size=EXPORT_BATCH_SIZE):
+    """Потоковое чтение таблицы с keyset-пагинацией по id"""
+    select, id_column = EXPORT_QUERIES[table]
+    query = f'{select} WHERE {id_column} > ? ORDER BY {id_column} LIMIT ?'
+
+    last_id = 0
+    while True:
+        rows = conn.execute(query, (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+
+        yield from rows
+        last_id = rows[-1][0]
+
+
+def export_table(db_path, table, out, fmt='ndjson', batch_size=EXPORT_BATCH_SIZE):
+    """Выгрузка таблицы в NDJSON или CSV, возвращает количество строк"""
+    columns = TABLES[table]
+    conn = sqlite3.connect(db_path)
+    count = 0
+
+    try:
+        if fmt == 'csv':
+            writer = csv.writer(out)
+            writer.writerow(columns)
+            for row in iter_rows(conn, table, batch_size):
+                writer.writerow(row)
+                count += 1
+        else:
+            for row in iter_rows(conn, table, batch_size):
+                out.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+                out.write('\n')
+                count += 1
+    finally:
+        conn.close()
+
+    return count
+
+
+class RecordError(ValueError):
+    """Ошибка во входных данных импорта с номером строки"""
+
+
+def record_values(record, columns, line_number, item_ids=None):
+    """Кортеж значений колонок записи с проверкой целых чисел
+
+    Если передан item_ids (ключ -> id предмета в целевой базе), item_key
+    заменяется на id; неизвестный ключ - ошибка, а не чужой предмет.
+    """
+    values = []
+    for column in columns:
+        value = record.get(column)
+        if column == 'item_key' and item_ids is not None:
+            if value not in item_ids:
+                raise RecordError(f'строка {line_number}: предмет {value!r} не найден в таблице items, '
+                                  f'сначала загрузите items')
+            value = item_ids[value]
+        elif value is not None and column in INTEGER_COLUMNS:
+            try:
+                if isinstance(value, bool) or not isinstance(value, (int, str)):
+                    raise ValueError
+                value = int(value)
+            except ValueError:
+                raise RecordError(f'строка {line_number}: {column} должен быть целым числом, '
+                                  f'получено {value!r}') from None
+        values.append(value)
+    return tuple(values)
+
+
+def read_records(src, table, fmt='ndjson', item_ids=None):
+    """Ленивое чтение записей из NDJSON или CSV в виде кортежей колонок"""
+    columns = TABLES[table]
+
+    if fmt == 'csv':
+        reader = csv.DictReader(src)
+        for record in reader:
+            # в CSV нет NULL, пустая строка считается отсутствующим значением
+            record = {column: value or None for column, value in record.items()}
+            yield record_values(record, columns, reader.line_num, item_ids)
+    else:
+        for line_number, line in enumerate(src, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise RecordError(f'строка {line_number}: неверный JSON ({e})') from None
+            if not isinstance(record, dict):
+                raise RecordError(f'строка {line_number}: ожидается JSON-объект')
+            yield record_values(record, columns, line_number, item_ids)
+
+
+def import_table(db_path, table, src, fmt='ndjson', batch_size=IMPORT_BATCH_SIZE,
+                 defer_indexes=False, replace=False):
+    """Массовая загрузка таблицы пачками executemany, возвращает количество строк
+
+    Предметы сопоставляются по key: в items добавляются только отсутствующие
+    ключи (с replace - обновляются и существующие), а item_key предметов
+    игроков переводится в id целевой базы.
+    """
+    db_manager = DatabaseManager(db_path)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    # на время загрузки не ждем синхронизации с диском после каждого коммита
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA temp_store = MEMORY')
+
+    if table == 'items':
+        query = '''
+            INSERT INTO items (key, name, price, active) VALUES (?, ?, ?, ?)
+            ON CONFLICT (key) DO ''' + ('''UPDATE SET
+                name = excluded.name, price = excluded.price, active = excluded.active'''
+                                        if replace else 'NOTHING')
+        # id из выгрузки не переносится
+        records = (record[1:] for record in read_records(src, table, fmt))
+    else:
+        columns = ('id', 'account_id', 'item_id', 'quantity') if table == 'player_items' else TABLES[table]
+        verb = 'INSERT OR REPLACE' if replace else 'INSERT'
+        query = (f'{verb} INTO {table} ({", ".join(columns)}) '
+                 f'VALUES ({", ".join("?" * len(columns))})')
+
+        item_ids = None
+        if table == 'player_items':
+            item_ids = dict(conn.execute('SELECT key, id FROM items'))
+        records = read_records(src, table, fmt, item_ids)
+    count = 0
+    batches = 0
+    indexes_dropped = False
+
+    try:
+        if defer_indexes:
+            db_manager.drop_indexes(conn)
+            indexes_dropped = True
+
+        conn.execute('BEGIN')
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+
+            conn.executemany(query, batch)
+            count += len(batch)
+            batches += 1
+
+            if batches % BATCHES_PER_TRANSACTION == 0:
+                conn.execute('COMMIT')
+                conn.execute('BEGIN')
+
+        conn.execute('COMMIT')
+
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        # индексы восстанавливаются и после ошибки загрузки
+        if indexes_dropped:
+            conn.execute('BEGIN')
+            db_manager.create_indexes(conn)
+            conn.execute('COMMIT')
+        conn.close()
+
+    return count
+
+
+def open_stream(path, mode):
+    """Открытие файла или stdin/stdout для пути '-'"""
+    if path == '-':
+        return sys.stdin if 'r' in mode else sys.stdout
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Выгрузка и загрузка аккаунтов и инвентарей')
+    parser.add_argument('--db', default='game_database.db', help='путь к базе данных')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='выгрузить таблицу')
+    export_parser.add_argument('table', choices=TABLES)
+    export_parser.add_argument('--out', default='-', help="файл ('-' для stdout)")
+    export_parser.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson')
+    export_parser.add_argument('--batch-size', type=int, default=EXPORT_BATCH_SIZE)
+
+    import_parser = subparsers.add_parser('import', help='загрузить таблицу')
+    import_parser.add_argument('table', choices=TABLES)
+    import_parser.add_argument('--in', dest='src', default='-', help="файл ('-' для stdin)")
+    import_parser.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson')
+    import_parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+    import_parser.add_argument('--defer-indexes', action='store_true',
+                               help='создать индексы после загрузки')
+    import_parser.add_argument('--replace', action='store_true',
+                               help='заменять строки с совпадающим id')
+
+    args = parser.parse_args(argv)
+    started = time.perf_counter()
+
+    if args.command == 'export':
+        stream = open_stream(args.out, 'w')
+        try:
+            count = export_table(args.db, args.table, stream, args.format, args.batch_size)
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        action = 'Выгружено'
+    else:
+        stream = open_stream(args.src, 'r')
+        try:
+            count = import_table(args.db, args.table, stream, args.format, args.batch_size,
+                                 args.defer_indexes, args.replace)
+        except sqlite3.IntegrityError as e:
+            print(f"Ошибка загрузки: {e}. Строки с совпадающим id заменяет --replace", file=sys.stderr)
+            sys.exit(1)
+        except RecordError as e:
+            print(f"Ошибка загрузки: {e}", file=sys.stderr)
+            sys.exit(1)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        action = 'Загружено'
+
+    elapsed = time.perf_counter() - started
+    print(f"{action} строк: {count} ({args.table}) за {elapsed:.2f} с", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
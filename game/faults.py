@@ -0,0 +1,252 @@
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from client import GameClient
+from gateway import Gateway
+from server import GameConfig, GameServer
+
+CHECK_NICKNAME = 'fault_player'
+
+
+class LossyProxy:
+    """TCP-прокси между клиентом и сервером, теряющий часть запросов и ответов
+
+    Потерянный запрос не доходит до сервера, потерянный ответ сервер уже
+    отправил, но клиент его не получает и ждет до таймаута.
+    """
+
+    def __init__(self, upstream, drop_requests=0.0, drop_responses=0.2, seed=None):
+        self.upstream = upstream
+        self.drop_requests = drop_requests
+        self.drop_responses = drop_responses
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.dropped_requests = 0
+        self.dropped_responses = 0
+        # вызывается вместо отправки следующего ответа: потеря в заданный момент
+        self.on_next_response = None
+
+        self.socket = socket.create_server(('localhost', 0))
+        self.host, self.port = self.socket.getsockname()[:2]
+
+    def start(self):
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+
+    def accept_loop(self):
+        while True:
+            client_socket, _ = self.socket.accept()
+            threading.Thread(target=self.relay, args=(client_socket,), daemon=True).start()
+
+    def drop(self, rate):
+        with self.lock:
+            return self.random.random() < rate
+
+    def relay(self, client_socket):
+        upstream = socket.create_connection(self.upstream)
+        try:
+            while True:
+                request = client_socket.recv(65536)
+                if not request:
+                    break
+
+                if self.drop(self.drop_requests):
+                    self.dropped_requests += 1
+                    continue
+                upstream.sendall(request)
+
+                response = upstream.recv(65536)
+                if not response:
+                    break
+
+                with self.lock:
+                    on_response, self.on_next_response = self.on_next_response, None
+                if on_response is not None:
+                    self.dropped_responses += 1
+                    on_response()
+                    continue
+
+                if self.drop(self.drop_responses):
+                    self.dropped_responses += 1
+                    continue
+                client_socket.sendall(response)
+        except OSError:
+            pass
+        finally:
+            upstream.close()
+            client_socket.close()
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def start_server(db_path):
+    server = GameServer(port=0, db_path=db_path)
+    threading.Thread(target=server.start, daemon=True).start()
+    wait_for(lambda: server.ready)
+    return server
+
+
+def run_check(trades=100, drop_requests=0.1, drop_responses=0.2, timeout=0.1, use_ids=True, seed=None,
+              gateway=False):
+    """Сделки через теряющий прокси; каждая подтвержденная сделка должна примениться ровно один раз
+
+    С gateway игрок ходит через шлюз к двум серверам на общей базе, а в
+    середине проверки его сервер удаляется из шлюза сразу после сделки,
+    ответ на которую потерян: повтор выполняет уже другой сервер.
+    """
+    rng = random.Random(seed)
+    admin_token = GameConfig.ADMIN_TOKEN
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'faults.db')
+        servers = {}
+        for _ in range(2 if gateway else 1):
+            server = start_server(db_path)
+            servers[f'{server.host}:{server.port}'] = server
+
+        if gateway:
+            # attach_session при переносе игрока требует токен администратора
+            GameConfig.ADMIN_TOKEN = admin_token or 'faults'
+            front = Gateway(port=0, backends=list(servers))
+            threading.Thread(target=front.start, daemon=True).start()
+            wait_for(lambda: front.port)
+            upstream = (front.host, front.port)
+        else:
+            front = None
+            upstream = (server.host, server.port)
+
+        def owner():
+            """Сервер, на котором сейчас сессия игрока"""
+            if front is None:
+                return server
+            with front.lock:
+                return servers.get(front.sessions.get(CHECK_NICKNAME))
+
+        removed = []
+
+        def remove_owner():
+            address = front.sessions.get(CHECK_NICKNAME)
+            front.remove_backend(address)
+            removed.append(address)
+
+        proxy = LossyProxy(upstream, drop_requests, drop_responses, seed)
+        proxy.start()
+
+        client = GameClient(proxy.host, proxy.port, timeout=timeout)
+        # повторяем, пока не получим ответ: потеря не должна оставлять сделку неизвестной
+        client.MUTATION_RETRIES = 50
+
+        def send(request):
+            if use_ids:
+                return client.send_mutation(request)
+            # повторы без request_id: так клиенты делали раньше
+            return client.send_request(request, retries=client.MUTATION_RETRIES)
+
+        try:
+            # вывод клиента в консоль здесь не нужен
+            with contextlib.redirect_stdout(io.StringIO()):
+                client.connect()
+                login = send({'action': 'login', 'nickname': CHECK_NICKNAME})
+            if not login or login.get('status') != 'success':
+                return {'passed': False, 'error': 'вход не выполнен'}
+
+            # кредитов с запасом, чтобы покупки не упирались в баланс
+            owner().grant_bonus(credits=10 ** 6)
+            account = owner().active_sessions[CHECK_NICKNAME]
+            credits, owned = account['credits'], account['items'].get('rope', 0)
+            price = owner().catalog.get('rope').price
+
+            started = time.perf_counter()
+            unanswered = replayed = 0
+            for number in range(trades):
+                if front is not None and number == trades // 2:
+                    # сделка выполнится, ответ потеряется, а сервер игрока уйдет из шлюза
+                    proxy.on_next_response = remove_owner
+
+                action = 'buy_item' if owned == 0 or rng.random() < 0.6 else 'sell_item'
+                with contextlib.redirect_stdout(io.StringIO()):
+                    response = send({'action': action, 'nickname': CHECK_NICKNAME, 'item_id': 'rope'})
+
+                if response is None:
+                    unanswered += 1
+                    continue
+                replayed += bool(response.get('replayed'))
+                if response.get('status') != 'success':
+                    continue
+
+                # ожидаемый результат по подтвержденным сделкам
+                if action == 'buy_item':
+                    credits -= price
+                    owned += 1
+                else:
+                    credits += price // 2
+                    owned -= 1
+            elapsed = time.perf_counter() - started
+
+            holder = owner()
+            session = holder.active_sessions.get(CHECK_NICKNAME) if holder is not None else None
+            stored = holder.db_manager.get_account(CHECK_NICKNAME) if holder is not None else None
+            actual = {
+                'session': (session['credits'], session['items'].get('rope', 0)) if session else None,
+                'database': (stored['credits'], stored['items'].get('rope', 0)) if stored else None,
+            }
+            passed = unanswered == 0 and all(value == (credits, owned) for value in actual.values())
+            if front is not None:
+                passed = passed and len(removed) == 1
+
+            result = {
+                'passed': passed,
+                'trades': trades,
+                'use_ids': use_ids,
+                'dropped_requests': proxy.dropped_requests,
+                'dropped_responses': proxy.dropped_responses,
+                'replayed': replayed,
+                'unanswered': unanswered,
+                'expected': (credits, owned),
+                **actual,
+                'seconds': round(elapsed, 2),
+            }
+            if front is not None:
+                result['removed_backend'] = removed[0] if removed else None
+            return result
+        finally:
+            GameConfig.ADMIN_TOKEN = admin_token
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Проверка повторов с request_id: сделки через прокси, теряющий запросы и ответы')
+    parser.add_argument('--trades', type=int, default=100)
+    parser.add_argument('--drop-requests', type=float, default=0.1, help='доля потерянных запросов')
+    parser.add_argument('--drop-responses', type=float, default=0.2, help='доля потерянных ответов')
+    parser.add_argument('--timeout', type=float, default=0.1, help='таймаут ответа клиента, секунд')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--no-ids', action='store_true',
+                        help='повторять без request_id (ожидается провал проверки)')
+    parser.add_argument('--gateway', action='store_true',
+                        help='через шлюз к двум серверам, с удалением сервера игрока в середине')
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    result = run_check(args.trades, args.drop_requests, args.drop_responses, args.timeout,
+                       not args.no_ids, args.seed, args.gateway)
+    print(json.dumps(result))
+    if not result['passed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,559 @@
+import argparse
+import bisect
+import hashlib
+import itertools
+import json
+import logging
+import os
+import queue
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import Pool
+
+from server import GameConfig, check_admin_token
+from startup import new_ready_file, start_server_process, wait_until_ready
+
+logger = logging.getLogger(__name__)
+
+# сервер удаляется из шлюза после стольких неудачных обращений подряд
+BACKEND_MAX_FAILURES = 3
+
+# таймаут проверки health после ошибки запроса, секунд
+HEALTH_PROBE_TIMEOUT = 1
+
+# действия, относящиеся к каждому серверу, а не к игроку: рассылаются всем.
+# get_trade_stats каждый сервер считает по своим сделкам
+BROADCAST_ACTIONS = ('reload_items', 'profile_start', 'profile_stop', 'memory_snapshot', 'get_stage_timings',
+                     'get_trade_stats')
+
+
+def parse_address(address):
+    """'host:port' -> ('host', port)"""
+    host, _, port = address.rpartition(':')
+    return host or 'localhost', int(port)
+
+
+class HashRing:
+    """Кольцо консистентного хеширования с виртуальными узлами"""
+
+    def __init__(self, nodes=(), replicas=100):
+        self.replicas = replicas
+        self.keys = []
+        self.owners = {}
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def hash(value):
+        return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+    def add(self, node):
+        """Добавление узла: он забирает примерно 1/N ключей у остальных"""
+        for i in range(self.replicas):
+            point = self.hash(f'{node}#{i}')
+            if point not in self.owners:
+                bisect.insort(self.keys, point)
+                self.owners[point] = node
+
+    def remove(self, node):
+        """Удаление узла: его ключи переходят к соседям по кольцу"""
+        for i in range(self.replicas):
+            point = self.hash(f'{node}#{i}')
+            if self.owners.get(point) == node:
+                del self.owners[point]
+                self.keys.pop(bisect.bisect_left(self.keys, point))
+
+    def get(self, key):
+        """Узел, отвечающий за ключ, или None для пустого кольца"""
+        if not self.keys:
+            return None
+        index = bisect.bisect(self.keys, self.hash(key)) % len(self.keys)
+        return self.owners[self.keys[index]]
+
+    def nodes(self):
+        return sorted(set(self.owners.values()))
+
+
+class BackendPool:
+    """Пул постоянных соединений к одному игровому серверу
+
+    Запросы всех клиентов шлюза разделяют эти соединения: каждый запрос
+    берет свободное соединение на время одного обмена запрос-ответ.
+    """
+
+    def __init__(self, address, size=8, timeout=5):
+        self.address = address
+        self.host, self.port = parse_address(address)
+        self.size = size
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+        self.closed = False
+        # сервер признан недоступным, сессии с него переносятся без logout
+        self.failed = False
+        self.failures = 0
+        self.failures_lock = threading.Lock()
+
+    def acquire(self):
+        """Свободное соединение из пула или новое, если пул еще не заполнен"""
+        self.slots.acquire()
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        try:
+            return socket.create_connection((self.host, self.port), timeout=self.timeout)
+        except OSError:
+            self.slots.release()
+            raise
+
+    def release(self, conn, broken=False):
+        """Возврат соединения в пул, сломанные соединения закрываются"""
+        if broken or self.closed:
+            conn.close()
+        else:
+            self.idle.put(conn)
+        self.slots.release()
+
+    def request(self, payload):
+        """Один обмен запрос-ответ, payload и ответ - байты JSON"""
+        conn = self.acquire()
+        try:
+            conn.sendall(payload)
+            response = conn.recv(65536)
+            if not response:
+                raise ConnectionError(f'Сервер {self.address} закрыл соединение')
+        except OSError:
+            self.release(conn, broken=True)
+            raise
+
+        self.release(conn)
+        return response
+
+    def probe(self):
+        """Проверка health на отдельном соединении: сервер отвечает, даже если занят долгим запросом"""
+        try:
+            with socket.create_connection((self.host, self.port), timeout=HEALTH_PROBE_TIMEOUT) as conn:
+                conn.sendall(b'{"action": "health"}')
+                return json.loads(conn.recv(65536)).get('status') == 'success'
+        except (OSError, ValueError):
+            return False
+
+    def record_failure(self):
+        """Учет неудачного обращения, возвращает число неудач подряд"""
+        with self.failures_lock:
+            self.failures += 1
+            return self.failures
+
+    def record_success(self):
+        self.failures = 0
+
+    def close(self):
+        """Закрытие всех простаивающих соединений"""
+        self.closed = True
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class Gateway:
+    """Шлюз: принимает клиентов и распределяет игроков по игровым серверам
+
+    Игрок закрепляется за сервером при входе. При добавлении или удалении
+    сервера открытые сессии переносятся на нового владельца по кольцу:
+    logout на старом сервере и attach_session (без бонуса) на новом.
+    """
+
+    def __init__(self, host='localhost', port=12345, backends=(), pool_size=8):
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self.ring = HashRing()
+        self.pools = {}
+        self.sessions = {}
+        self.lock = threading.RLock()
+        self.round_robin = itertools.count()
+
+        for address in backends:
+            self.add_backend(address, rebalance=False, probe=False)
+
+    def add_backend(self, address, rebalance=True, probe=True):
+        """Подключение сервера к кольцу, None - сервер не отвечает на health"""
+        pool = BackendPool(address, self.pool_size)
+        if probe and not pool.probe():
+            logger.error(f"Сервер {address} не отвечает, в шлюз не добавлен")
+            return None
+
+        with self.lock:
+            if address in self.pools:
+                return []
+            self.pools[address] = pool
+            self.ring.add(address)
+            logger.info(f"Сервер {address} добавлен в шлюз")
+            moves = self.plan_moves() if rebalance else []
+        return self.move_sessions(moves)
+
+    def remove_backend(self, address):
+        """Отключение сервера от кольца с переносом его сессий"""
+        with self.lock:
+            pool = self.pools.pop(address, None)
+            if pool is None:
+                return []
+            self.ring.remove(address)
+            moves = self.plan_moves(old_pool=pool)
+        logger.info(f"Сервер {address} удален из шлюза")
+
+        moved = self.move_sessions(moves)
+        pool.close()
+        return moved
+
+    def plan_moves(self, old_pool=None):
+        """Сессии, владелец которых по кольцу изменился: [(ник, старый сервер, старый пул, новый сервер)]
+
+        Вызывается под self.lock, сам перенос выполняет move_sessions уже без блокировки.
+        """
+        moves = []
+        for nickname, address in self.sessions.items():
+            owner = self.ring.get(nickname)
+            if owner == address:
+                continue
+
+            pool = self.pools.get(address)
+            if pool is None and old_pool is not None and old_pool.address == address:
+                pool = old_pool
+            moves.append((nickname, address, pool, owner))
+        return moves
+
+    def move_sessions(self, moves):
+        """Перенос сессий: attach_session на новом сервере, затем logout на старом
+
+        Обмен с серверами идет без блокировки шлюза, чтобы не останавливать
+        остальных игроков. Если attach не удался, игрок остается на старом
+        сервере, пока тот в кольце.
+        """
+        moved = []
+        for nickname, address, old_pool, owner in moves:
+            attached = owner is not None and self.attach(owner, nickname)
+
+            with self.lock:
+                pinned = self.sessions.get(nickname) == address
+                if pinned and attached:
+                    self.sessions[nickname] = owner
+                elif pinned and address not in self.pools:
+                    # старого сервера больше нет, игроку придется войти заново
+                    del self.sessions[nickname]
+
+            if not attached:
+                continue
+            moved.append(nickname)
+
+            if old_pool is not None and not old_pool.failed:
+                try:
+                    old_pool.request(self.encode({'action': 'logout', 'nickname': nickname}))
+                except OSError:
+                    pass
+
+        if moved:
+            logger.info(f"Перенесено сессий: {len(moved)}")
+        return moved
+
+    def attach(self, address, nickname):
+        """Открытие сессии игрока на сервере без бонуса за вход"""
+        if not GameConfig.ADMIN_TOKEN:
+            return False
+
+        pool = self.pools.get(address)
+        if pool is None:
+            return False
+
+        request = {'action': 'attach_session', 'nickname': nickname,
+                   'admin_token': GameConfig.ADMIN_TOKEN}
+        try:
+            response = json.loads(pool.request(self.encode(request)))
+        except (OSError, ValueError):
+            return False
+        return response.get('status') == 'success'
+
+    @staticmethod
+    def encode(message):
+        return json.dumps(message, ensure_ascii=False).encode('utf-8')
+
+    def route(self, request):
+        """Выбор сервера: закрепленный за игроком, по кольцу или по кругу"""
+        nickname = request.get('nickname')
+        with self.lock:
+            if isinstance(nickname, str) and nickname:
+                address = self.sessions.get(nickname)
+                # сервер игрока уже удален, а перенос сессии еще идет
+                if address not in self.pools:
+                    address = self.ring.get(nickname)
+                return address
+
+            nodes = self.ring.nodes()
+            if not nodes:
+                return None
+            return nodes[next(self.round_robin) % len(nodes)]
+
+    def forward(self, request, payload):
+        """Пересылка запроса на сервер и учет входа/выхода игрока"""
+        address = self.route(request)
+        pool = self.pools.get(address)
+        if pool is None:
+            return self.encode({'status': 'error', 'message': 'Нет доступных серверов'})
+
+        try:
+            response = pool.request(payload)
+        except OSError as e:
+            logger.error(f"Ошибка запроса к серверу {address}: {e}")
+            # таймаут долгого запроса не повод удалять работающий сервер
+            if not pool.probe() and pool.record_failure() >= BACKEND_MAX_FAILURES:
+                pool.failed = True
+                self.remove_backend(address)
+            return self.encode({'status': 'error', 'message': 'Сервер недоступен, повторите запрос', 'retry': True})
+
+        pool.record_success()
+
+        action = request.get('action')
+        nickname = request.get('nickname')
+        if action in ('login', 'logout'):
+            try:
+                success = json.loads(response).get('status') == 'success'
+            except ValueError:
+                success = False
+
+            with self.lock:
+                if action == 'login' and success:
+                    self.sessions[nickname] = address
+                elif action == 'logout':
+                    self.sessions.pop(nickname, None)
+
+        return response
+
+    def broadcast(self, payload):
+        """Пересылка запроса всем серверам, ответ - ответы каждого сервера"""
+        with self.lock:
+            pools = list(self.pools.values())
+
+        results = {}
+        for pool in pools:
+            try:
+                results[pool.address] = json.loads(pool.request(payload))
+            except (OSError, ValueError) as e:
+                results[pool.address] = {'status': 'error', 'message': str(e)}
+
+        success = results and all(result.get('status') == 'success' for result in results.values())
+        return self.encode({'status': 'success' if success else 'error', 'backends': results})
+
+    def process_request(self, request, payload):
+        """Служебные действия шлюза обрабатываются на месте, остальные пересылаются"""
+        action = request.get('action')
+
+        if action in ('gateway_add_backend', 'gateway_remove_backend', 'gateway_status'):
+            if not check_admin_token(request):
+                return self.encode({'status': 'error', 'message': 'Нет доступа'})
+
+            if action in ('gateway_add_backend', 'gateway_remove_backend'):
+                backend = request.get('backend')
+                try:
+                    parse_address(backend)
+                except (AttributeError, TypeError, ValueError):
+                    return self.encode({'status': 'error', 'message': 'Неверный адрес backend, ожидается host:port'})
+
+                if action == 'gateway_add_backend':
+                    moved = self.add_backend(backend)
+                    if moved is None:
+                        return self.encode({'status': 'error', 'message': f'Сервер {backend} недоступен'})
+                else:
+                    moved = self.remove_backend(backend)
+                return self.encode({'status': 'success', 'moved_sessions': len(moved)})
+
+            with self.lock:
+                return self.encode({
+                    'status': 'success',
+                    'backends': self.ring.nodes(),
+                    'sessions': len(self.sessions)
+                })
+
+        # состояние каждого сервера (каталог, профилировщик) меняется на всех сразу
+        if action in BROADCAST_ACTIONS:
+            return self.broadcast(payload)
+
+        return self.forward(request, payload)
+
+    def start(self):
+        """Запуск шлюза"""
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+        try:
+            server_socket.bind((self.host, self.port))
+            server_socket.listen(128)
+            self.port = server_socket.getsockname()[1]
+            logger.info(f"Шлюз запущен на {self.host}:{self.port}, серверы: {self.ring.nodes()}")
+
+            while True:
+                client_socket, addr = server_socket.accept()
+                client_thread = threading.Thread(target=self.handle_client, args=(client_socket, addr))
+                client_thread.daemon = True
+                client_thread.start()
+
+        except KeyboardInterrupt:
+            logger.info("Сигнал об остановке шлюза")
+        finally:
+            server_socket.close()
+            with self.lock:
+                for pool in self.pools.values():
+                    pool.close()
+
+    def handle_client(self, client_socket, addr):
+        """Обработка клиента шлюза"""
+        try:
+            while True:
+                data = client_socket.recv(1024)
+                if not data:
+                    break
+
+                try:
+                    request = json.loads(data.decode('utf-8'))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    client_socket.sendall(self.encode({'status': 'error', 'message': 'Неверный формат JSON'}))
+                    continue
+
+                if not isinstance(request, dict):
+                    client_socket.sendall(self.encode({'status': 'error', 'message': 'Неверный формат JSON'}))
+                    continue
+
+                client_socket.sendall(self.process_request(request, data))
+
+        except Exception as e:
+            logger.error(f"Ошибка обработки клиента {addr}: {e}")
+        finally:
+            client_socket.close()
+
+
+def bench_worker(args):
+    """Один игрок бенчмарка: вход, сделки, выход; возвращает задержки запросов"""
+    address, nickname, rounds = args
+    conn = socket.create_connection(parse_address(address), timeout=30)
+    latencies = []
+
+    def call(request):
+        started = time.perf_counter()
+        conn.sendall(json.dumps(request).encode('utf-8'))
+        response = json.loads(conn.recv(65536))
+        latencies.append(time.perf_counter() - started)
+        return response
+
+    call({'action': 'login', 'nickname': nickname})
+    for _ in range(rounds):
+        call({'action': 'buy_item', 'nickname': nickname, 'item_id': 'rope'})
+        call({'action': 'sell_item', 'nickname': nickname, 'item_id': 'rope'})
+        call({'action': 'get_account_info', 'nickname': nickname})
+    call({'action': 'logout', 'nickname': nickname})
+
+    conn.close()
+    return latencies
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10):
+    """Ожидание, пока процесс начнет принимать соединения"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('localhost', port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.02)
+    return False
+
+
+def run_benchmark(backend_count, players=32, rounds=50):
+    """Сквозной бенчмарк: клиенты -> шлюз -> backend_count игровых серверов"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    processes = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'game.db')
+        try:
+            backends = []
+            for _ in range(backend_count):
+                ready_file = new_ready_file()
+                process = start_server_process(os.path.join(here, 'server.py'),
+                                               ['--port', '0', '--db', db_path],
+                                               ready_file, quiet=True)
+                processes.append(process)
+                # серверы по очереди, чтобы схема БД создавалась одним процессом
+                ready = wait_until_ready(ready_file, process)
+                if not ready:
+                    raise RuntimeError('Игровой сервер не запустился')
+                backends.append(f"localhost:{ready['port']}")
+
+            gateway_port = free_port()
+            command = [sys.executable, os.path.join(here, 'gateway.py'), '--port', str(gateway_port)]
+            for backend in backends:
+                command += ['--backend', backend]
+            processes.append(subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+            wait_for_port(gateway_port)
+
+            jobs = [(f'localhost:{gateway_port}', f'bench_{i}', rounds) for i in range(players)]
+            started = time.perf_counter()
+            with Pool(players) as pool:
+                results = pool.map(bench_worker, jobs)
+            elapsed = time.perf_counter() - started
+
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait()
+
+    latencies = sorted(latency for result in results for latency in result)
+    return {
+        'backends': backend_count,
+        'requests': len(latencies),
+        'seconds': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 2)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Шлюз для нескольких игровых серверов')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=12345)
+    parser.add_argument('--backend', action='append', default=[],
+                        help='адрес игрового сервера host:port (можно указать несколько раз)')
+    parser.add_argument('--pool-size', type=int, default=8, help='соединений на один сервер')
+    parser.add_argument('--bench', type=int, nargs='+', metavar='N',
+                        help='бенчмарк с указанным числом серверов, например --bench 1 4')
+    parser.add_argument('--players', type=int, default=32)
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        for backend_count in args.bench:
+            print(json.dumps(run_benchmark(backend_count, args.players, args.rounds)))
+        return
+
+    if not args.backend:
+        parser.error('нужен хотя бы один --backend')
+
+    Gateway(args.host, args.port, args.backend, args.pool_size).start()
+
+
+if __name__ == '__main__':
+    main()
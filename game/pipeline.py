@@ -0,0 +1,262 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class Field:
+    """Описание параметра запроса для схемы действия"""
+
+    __slots__ = ('types', 'required', 'choices')
+
+    def __init__(self, types, required=True, choices=None):
+        self.types = types if isinstance(types, tuple) else (types,)
+        self.required = required
+        self.choices = choices
+
+
+def compile_schema(schema):
+    """Схема {имя: Field} -> функция проверки запроса, возвращающая текст ошибки или None"""
+    if not schema:
+        return None
+
+    checks = []
+    for name, field in schema.items():
+        # bool - подкласс int, но True в качестве количества не принимаем
+        reject_bool = int in field.types and bool not in field.types
+        checks.append((name, field.types, field.required, field.choices, reject_bool))
+    checks = tuple(checks)
+
+    def validate(request):
+        for name, types, required, choices, reject_bool in checks:
+            value = request.get(name)
+            if value is None or value == '':
+                if required:
+                    return f'Не указан {name}'
+                continue
+            if not isinstance(value, types) or (reject_bool and isinstance(value, bool)):
+                return f'Неверный параметр {name}'
+            if choices is not None and value not in choices:
+                return f'Неверный параметр {name}'
+        return None
+
+    return validate
+
+
+class ActionSpec:
+    """Описание действия: обработчик, схема параметров и требования доступа"""
+
+    __slots__ = ('name', 'handler', 'validate', 'auth', 'admin', 'item', 'idempotent')
+
+    def __init__(self, name, handler, schema=None, auth=False, admin=False, item=False, idempotent=False):
+        self.name = name
+        self.handler = handler
+        self.validate = compile_schema(schema)
+        self.auth = auth
+        self.admin = admin
+        self.item = item
+        self.idempotent = idempotent
+
+
+class ActionRegistry:
+    """Реестр действий сервера"""
+
+    def __init__(self):
+        self.actions = {}
+
+    def register(self, name, handler, schema=None, auth=False, admin=False, item=False, idempotent=False):
+        """Регистрация действия
+
+        auth       - нужна открытая сессия игрока (ctx.account),
+        admin      - нужен токен служебных действий,
+        item       - параметр item_id должен быть предметом каталога (ctx.item),
+        idempotent - повтор запроса с тем же request_id получает сохраненный ответ.
+        """
+        if name in self.actions:
+            raise ValueError(f'Действие {name} уже зарегистрировано')
+        self.actions[name] = ActionSpec(name, handler, schema, auth, admin, item, idempotent)
+
+    def get(self, name):
+        return self.actions.get(name) if isinstance(name, str) else None
+
+    def __iter__(self):
+        return iter(self.actions)
+
+
+class RequestContext:
+    """Состояние запроса при прохождении по конвейеру"""
+
+    __slots__ = ('action', 'request', 'spec', 'account', 'item', 'trade', 'inner_time')
+
+    def __init__(self, action, request, spec):
+        self.action = action
+        self.request = request
+        self.spec = spec
+        self.account = None
+        self.item = None
+        # совершенная сделка (предмет, цена, покупка ли), заполняет обработчик
+        self.trade = None
+        self.inner_time = 0.0
+
+
+class StageTimings:
+    """Накопленное собственное время каждого этапа конвейера"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def record(self, stage, elapsed):
+        with self.lock:
+            stat = self.stats.get(stage)
+            if stat is None:
+                self.stats[stage] = [1, elapsed, elapsed]
+            else:
+                stat[0] += 1
+                stat[1] += elapsed
+                if elapsed > stat[2]:
+                    stat[2] = elapsed
+
+    def snapshot(self, reset=False):
+        """{этап: count, total_ms, avg_us, max_us}"""
+        with self.lock:
+            stats, self.stats = (self.stats, {}) if reset else (dict(self.stats), self.stats)
+
+        return {
+            stage: {
+                'count': count,
+                'total_ms': round(total * 1000, 3),
+                'avg_us': round(total / count * 1e6, 2),
+                'max_us': round(longest * 1e6, 2)
+            }
+            for stage, (count, total, longest) in stats.items()
+        }
+
+
+def build_pipeline(stages, endpoint, timings):
+    """Сборка конвейера из промежуточных обработчиков
+
+    stages - список (имя, функция(ctx, call_next)), endpoint - функция(ctx).
+    Цепочка собирается один раз. Для каждого этапа учитывается только его
+    собственное время, без времени следующих этапов.
+    """
+
+    def timed(name, func):
+        def call(ctx):
+            started = time.perf_counter()
+            outer_inner, ctx.inner_time = ctx.inner_time, 0.0
+            try:
+                return func(ctx)
+            finally:
+                elapsed = time.perf_counter() - started
+                timings.record(name, elapsed - ctx.inner_time)
+                ctx.inner_time = outer_inner + elapsed
+        return call
+
+    chain = timed('handler', endpoint)
+    for name, middleware in reversed(stages):
+        chain = timed(name, lambda ctx, middleware=middleware, call_next=chain: middleware(ctx, call_next))
+    return chain
+
+
+class RateLimiter:
+    """Ограничение частоты запросов: корзина токенов на каждый ключ
+
+    Хранится не больше max_keys корзин, давно не использованные вытесняются.
+    """
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def allow(self, key):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+
+        return allowed
+
+
+class DedupeEntry:
+    """Ответ на запрос с request_id; пока запрос выполняется, response = None"""
+
+    __slots__ = ('expires', 'fingerprint', 'response', 'done')
+
+    def __init__(self, expires, fingerprint):
+        self.expires = expires
+        # параметры запроса: повтор с тем же id должен их совпадать
+        self.fingerprint = fingerprint
+        self.response = None
+        self.done = threading.Event()
+
+
+class DedupeCache:
+    """Недавние ответы на запросы с request_id для безопасных повторов
+
+    На каждый ключ (игрока) хранится не больше max_entries ответов, каждый не
+    дольше ttl секунд. Всего хранится не больше max_keys ключей, давно не
+    использованные вытесняются.
+    """
+
+    def __init__(self, ttl, max_entries, max_keys=10000, wait_timeout=5):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_keys = max_keys
+        self.wait_timeout = wait_timeout
+        self.keys = OrderedDict()
+        self.lock = threading.Lock()
+
+    def begin(self, key, request_id, fingerprint):
+        """(запись, None) для нового запроса или (None, ответ) для повтора
+
+        Повтор с другими параметрами (fingerprint) получает ошибку, а не чужой ответ.
+        """
+        now = time.monotonic()
+        with self.lock:
+            entries = self.keys.pop(key, None)
+            if entries is None:
+                entries = OrderedDict()
+            self.keys[key] = entries
+            if len(self.keys) > self.max_keys:
+                self.keys.popitem(last=False)
+
+            # записи упорядочены по времени добавления, устаревшие в начале
+            while entries and next(iter(entries.values())).expires <= now:
+                entries.popitem(last=False)
+
+            entry = entries.get(request_id)
+            if entry is None:
+                entry = entries[request_id] = DedupeEntry(now + self.ttl, fingerprint)
+                if len(entries) > self.max_entries:
+                    entries.popitem(last=False)
+                return entry, None
+
+        if entry.fingerprint != fingerprint:
+            return None, {'status': 'error', 'message': 'request_id уже использован для другого запроса'}
+
+        # повтор пришел, пока первый запрос еще выполняется
+        entry.done.wait(self.wait_timeout)
+        if entry.response is None:
+            # retry: ответ еще будет, клиент может повторить с тем же request_id
+            return None, {'status': 'error', 'message': 'Запрос еще выполняется, повторите позже', 'retry': True}
+        return None, dict(entry.response, replayed=True)
+
+    def finish(self, key, request_id, entry, response):
+        """Сохранение ответа; без ответа (ошибка обработки) запись удаляется"""
+        entry.response = response
+        if response is None:
+            with self.lock:
+                entries = self.keys.get(key)
+                if entries is not None and entries.get(request_id) is entry:
+                    del entries[request_id]
+        entry.done.set()
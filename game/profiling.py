@@ -0,0 +1,150 @@
+import cProfile
+import logging
+import os
+import threading
+import tracemalloc
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# общий профиль для запросов с действием, которого нет в реестре сервера
+UNKNOWN_ACTION = 'unknown'
+
+
+class RequestProfiler:
+    """Профилирование запросов сервера по требованию
+
+    Пока профилирование выключено, сервер вызывает свой обычный process_request:
+    профилировщик подменяет метод экземпляра только на время сеанса.
+    """
+
+    def __init__(self, server, output_dir='profiles'):
+        self.server = server
+        self.output_dir = output_dir
+        self.lock = threading.RLock()
+        self.active = False
+        self.profiles = {}
+        self.counts = {}
+        self.remaining = None
+        self.timer = None
+        self.memory_baseline = None
+
+    def start(self, requests=None, seconds=None):
+        """Включить профилирование на N запросов и/или T секунд"""
+        with self.lock:
+            if self.active:
+                return False
+
+            self.profiles = {}
+            self.counts = {}
+            self.remaining = requests
+            self.active = True
+            self.server.process_request = self.profiled_request
+
+            if seconds:
+                self.timer = threading.Timer(seconds, self.stop)
+                self.timer.daemon = True
+                self.timer.start()
+
+        logger.info(f"Профилирование включено (запросов: {requests}, секунд: {seconds})")
+        return True
+
+    def stop(self):
+        """Выключить профилирование и сохранить pstats, возвращает пути файлов"""
+        with self.lock:
+            if not self.active:
+                return []
+
+            self.active = False
+            # снова работает метод класса, без обертки
+            self.server.__dict__.pop('process_request', None)
+
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+
+            paths = self.dump()
+
+        logger.info(f"Профилирование выключено, сохранено файлов: {len(paths)}")
+        return paths
+
+    def profiled_request(self, request):
+        """Обработка запроса под cProfile отдельного профиля для каждого action"""
+        # имя профиля (и файла) - только зарегистрированное действие, не данные клиента
+        spec = self.server.registry.get(request.get('action'))
+        action = spec.name if spec is not None else UNKNOWN_ACTION
+        process_request = type(self.server).process_request
+
+        # управляющие действия самого профилировщика не профилируем
+        if action in ('profile_start', 'profile_stop', 'memory_snapshot'):
+            return process_request(self.server, request)
+
+        # во время сеанса запросы обрабатываются по одному, иначе профили смешиваются
+        with self.lock:
+            if not self.active:
+                return process_request(self.server, request)
+
+            profile = self.profiles.get(action)
+            if profile is None:
+                profile = self.profiles[action] = cProfile.Profile()
+
+            profile.enable()
+            try:
+                return process_request(self.server, request)
+            finally:
+                profile.disable()
+                self.counts[action] = self.counts.get(action, 0) + 1
+
+                if self.remaining is not None:
+                    self.remaining -= 1
+                    if self.remaining <= 0:
+                        self.stop()
+
+    def dump(self):
+        """Сохранение профилей в каталог вида profiles/<время>/<action>.pstats"""
+        if not self.profiles:
+            return []
+
+        session_dir = os.path.join(self.output_dir, datetime.now().strftime('%Y%m%d-%H%M%S'))
+        os.makedirs(session_dir, exist_ok=True)
+
+        paths = []
+        for action, profile in self.profiles.items():
+            path = os.path.join(session_dir, f'{action}.pstats')
+            profile.dump_stats(path)
+            paths.append(path)
+
+        self.profiles = {}
+        return paths
+
+    def memory_snapshot(self, top=10, stop=False):
+        """Снимок tracemalloc: первый вызов запоминает базу, следующие возвращают разницу"""
+        with self.lock:
+            if stop:
+                self.memory_baseline = None
+                if tracemalloc.is_tracing():
+                    tracemalloc.stop()
+                return None
+
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.memory_baseline = None
+
+            snapshot = tracemalloc.take_snapshot()
+            baseline, self.memory_baseline = self.memory_baseline, snapshot
+
+            if baseline is None:
+                return []
+
+            stats = snapshot.compare_to(baseline, 'lineno')
+            return [str(stat) for stat in stats[:top]]
+
+    def status(self):
+        """Текущее состояние профилировщика"""
+        with self.lock:
+            return {
+                'active': self.active,
+                'remaining': self.remaining,
+                'requests': dict(self.counts),
+                'tracing_memory': tracemalloc.is_tracing()
+            }
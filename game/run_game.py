@@ -3,6 +3,8 @@ import sys
 import os
 import time
 
+from startup import new_ready_file, start_server_process, wait_until_ready
+
 
 def run_game():
     """Запуск игры"""
@@ -20,15 +22,20 @@ def run_game():
     try:
         # запускаем сервер, должен запуститься на любой ос
         print("Запуск сервера")
-        if os.name == 'nt':  # под винду
-            server_process = subprocess.Popen([sys.executable, 'server.py'],
-                                              creationflags=subprocess.CREATE_NEW_CONSOLE)
-        else:  # под линуху или мак
-            server_process = subprocess.Popen([sys.executable, 'server.py'])
+        ready_file = new_ready_file()
+        server_process = start_server_process('server.py', ready_file=ready_file)
 
-        # Ждем запуска сервера
+        # ждем сигнала готовности от сервера, а не фиксированную паузу
         print("Ожидание запуска сервера")
-        time.sleep(3)
+        ready = wait_until_ready(ready_file, server_process)
+        if not ready:
+            print("Сервер не запустился")
+            if server_process.poll() is None:
+                server_process.terminate()
+            input("Нажмите Enter для выхода")
+            return
+
+        print(f"Сервер готов за {ready['total_ms']} мс")
 
         # тут запускаю клиент
         print("Запуск клиента")
@@ -64,4 +71,4 @@ def run_game():
 
 
 if __name__ == '__main__':
-    run_game()
\ No newline at end of file
+    run_game()
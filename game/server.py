@@ -1,15 +1,38 @@
+import time
+
+# отсчет времени холодного старта
+STARTED_AT = time.perf_counter()
+
 import socket
 import threading
 import json
 import sqlite3
 import random
 import logging
+import os
+import hmac
+import signal
+import argparse
+import errno
+import heapq
+from collections import namedtuple
 from datetime import datetime
 
+from analytics import WINDOWS, TradeAnalytics, TradeRollup
+from bonus import BonusScheduler, grant_bonus
+from catalog import ItemCatalog, CatalogError, load_catalog_file
+from pipeline import ActionRegistry, DedupeCache, Field, RateLimiter, RequestContext, StageTimings, build_pipeline
+from profiling import RequestProfiler
+
+IMPORT_SECONDS = time.perf_counter() - STARTED_AT
+
 # настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# результат DatabaseManager.trade; replayed - ответ взят из request_log, сделка не выполнялась
+TradeResult = namedtuple('TradeResult', ('credits', 'quantity', 'response', 'replayed'))
+
 
 class GameConfig:
     """Конфигурация игры"""
@@ -17,24 +40,84 @@ class GameConfig:
     # диапазон кредита при входе
     CREDITS_RANGE = (100, 500)
 
-    # арсенал
-    ITEMS = {
-        'sword': {'name': 'Меч', 'price': 150},
-        'shield': {'name': 'Щит', 'price': 120},
-        'armor': {'name': 'Броня', 'price': 300},
-        'bow': {'name': 'Лук', 'price': 200},
-        'potion': {'name': 'Зелье здоровья', 'price': 50},
-        'ship': {'name': 'Корабль', 'price': 1000},
-        'cannon': {'name': 'Пушка', 'price': 400},
-        'treasure_map': {'name': 'Карта сокровищ', 'price': 250},
-        'compass': {'name': 'Компас', 'price': 80},
-        'rope': {'name': 'Веревка', 'price': 30}
-    }
+    # токен для служебных действий (без него служебные действия отключены)
+    ADMIN_TOKEN = os.environ.get('GAME_ADMIN_TOKEN')
+
+    # сколько секунд профилировать после сигнала SIGUSR1
+    PROFILE_SIGNAL_SECONDS = 30
+
+    # бонус по расписанию, например {'interval': 86400, 'credits': 100, 'item_id': 'potion'};
+    # начисляет только сервер, запущенный с --bonus-scheduler (один на общую базу)
+    SCHEDULED_BONUS = None
+
+    # ограничение частоты запросов одного игрока: (запросов в секунду, запас) или None
+    RATE_LIMIT = None
+
+    # ответы на запросы с request_id для безопасных повторов: срок хранения, секунд,
+    # и число ответов на одного игрока в памяти сервера (сделки хранятся и в request_log)
+    DEDUPE_TTL = 300
+    DEDUPE_MAX_PER_ACCOUNT = 256
+
+    # как часто сохранять статистику сделок в таблицу trade_bars, секунд
+    TRADE_ROLLUP_SECONDS = 60
+
+    # размер страницы инвентаря: по умолчанию и максимальный
+    INVENTORY_PAGE_SIZE = 20
+    INVENTORY_MAX_PAGE_SIZE = 100
+
+    # арсенал: файл каталога, загружается в таблицу items при старте и по reload_items
+    ITEMS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'items.json')
+
+
+def check_admin_token(request):
+    """Проверка токена служебных действий"""
+    token = request.get('admin_token')
+    if not GameConfig.ADMIN_TOKEN or not isinstance(token, str):
+        return False
+    return hmac.compare_digest(token, GameConfig.ADMIN_TOKEN)
 
 
 class DatabaseManager:
     """Менеджер базы данных для работы с аккаунтами"""
 
+    # вторичные индексы: имя -> DDL (их можно снять на время массового импорта)
+    INDEXES = {
+        'idx_player_items_account_item':
+            'CREATE INDEX IF NOT EXISTS idx_player_items_account_item '
+            'ON player_items (account_id, item_id)',
+    }
+
+    PLAYER_ITEMS_TABLE_SQL = '''
+        CREATE TABLE IF NOT EXISTS player_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            account_id INTEGER,
+            item_id INTEGER,
+            quantity INTEGER DEFAULT 1,
+            FOREIGN KEY (account_id) REFERENCES accounts (id),
+            FOREIGN KEY (item_id) REFERENCES items (id)
+        )
+    '''
+
+    # серверы за шлюзом пишут в одну базу, поэтому сервер (node) входит в ключ
+    TRADE_BARS_TABLE_SQL = '''
+        CREATE TABLE IF NOT EXISTS trade_bars (
+            item_id INTEGER NOT NULL,
+            period_start TEXT NOT NULL,
+            node TEXT NOT NULL DEFAULT '',
+            open INTEGER,
+            high INTEGER,
+            low INTEGER,
+            close INTEGER,
+            volume INTEGER,
+            trades INTEGER,
+            buys INTEGER,
+            turnover INTEGER,
+            traders INTEGER,
+            PRIMARY KEY (item_id, period_start, node),
+            FOREIGN KEY (item_id) REFERENCES items (id)
+        )
+    '''
+
     def __init__(self, db_path='game_database.db'):
         self.db_path = db_path
         self.init_database()
@@ -55,21 +138,173 @@ class DatabaseManager:
             )
         ''')
 
-        # создание таблицы предметов игроков
+        # создание таблицы каталога предметов
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS player_items (
+            CREATE TABLE IF NOT EXISTS items (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                account_id INTEGER,
-                item_id TEXT,
-                quantity INTEGER DEFAULT 1,
+                key TEXT UNIQUE NOT NULL,
+                name TEXT NOT NULL,
+                price INTEGER NOT NULL,
+                active INTEGER DEFAULT 1
+            )
+        ''')
+
+        # создание таблицы предметов игроков
+        cursor.execute(self.PLAYER_ITEMS_TABLE_SQL)
+        conn.commit()
+
+        if self.player_items_use_text_ids(conn):
+            self.migrate_player_items(conn)
+
+        # минутная статистика сделок по предметам, отдельно от каждого сервера
+        cursor.execute(self.TRADE_BARS_TABLE_SQL)
+        if not self.table_has_column(conn, 'trade_bars', 'node'):
+            self.migrate_trade_bars(conn)
+
+        # время последнего начисления по расписанию, переживает перезапуск сервера
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scheduled_grants (
+                name TEXT PRIMARY KEY,
+                last_run REAL NOT NULL
+            )
+        ''')
+
+        # ответы на сделки с request_id: повтор через любой сервер не выполняет сделку заново
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS request_log (
+                account_id INTEGER NOT NULL,
+                request_id TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (account_id, request_id),
                 FOREIGN KEY (account_id) REFERENCES accounts (id)
             )
         ''')
+        cursor.execute('DELETE FROM request_log WHERE created_at < ?', (time.time() - GameConfig.DEDUPE_TTL,))
+
+        self.create_indexes(conn)
 
         conn.commit()
         conn.close()
         logger.info("База данных инициализирована")
 
+    def player_items_use_text_ids(self, conn):
+        """Старая схема: player_items.item_id хранит текстовый ключ предмета"""
+        for column in conn.execute('PRAGMA table_info(player_items)'):
+            if column[1] == 'item_id':
+                return column[2].upper() == 'TEXT'
+        return False
+
+    def table_has_column(self, conn, table, column):
+        return any(row[1] == column for row in conn.execute(f'PRAGMA table_info({table})'))
+
+    def migrate_trade_bars(self, conn):
+        """Добавление сервера (node) в ключ trade_bars, старые интервалы получают пустой node"""
+        conn.executescript(f'''
+            BEGIN;
+            ALTER TABLE trade_bars RENAME TO trade_bars_old;
+            {self.TRADE_BARS_TABLE_SQL};
+            INSERT INTO trade_bars (item_id, period_start, open, high, low, close,
+                                    volume, trades, buys, turnover, traders)
+                SELECT item_id, period_start, open, high, low, close,
+                       volume, trades, buys, turnover, traders
+                FROM trade_bars_old;
+            DROP TABLE trade_bars_old;
+            COMMIT;
+        ''')
+        logger.info("В таблицу trade_bars добавлен сервер (node)")
+
+    def migrate_player_items(self, conn):
+        """Перевод player_items.item_id с текстовых ключей на id из таблицы items"""
+        # неизвестные каталогу ключи заводятся как снятые с продажи предметы,
+        # название и цену для ключей из файла проставит sync_items
+        conn.executescript(f'''
+            BEGIN;
+            INSERT OR IGNORE INTO items (key, name, price, active)
+                SELECT DISTINCT item_id, item_id, 0, 0 FROM player_items;
+            ALTER TABLE player_items RENAME TO player_items_old;
+            {self.PLAYER_ITEMS_TABLE_SQL};
+            INSERT INTO player_items (id, account_id, item_id, quantity)
+                SELECT p.id, p.account_id, i.id, p.quantity
+                FROM player_items_old p JOIN items i ON i.key = p.item_id;
+            DROP TABLE player_items_old;
+            COMMIT;
+        ''')
+        logger.info("Таблица player_items переведена на числовые id предметов")
+
+    def sync_items(self, items):
+        """Загрузка каталога в таблицу items, отсутствующие в нем предметы снимаются с продажи"""
+        conn = sqlite3.connect(self.db_path)
+
+        with conn:
+            conn.executemany('''
+                INSERT INTO items (key, name, price, active) VALUES (?, ?, ?, 1)
+                ON CONFLICT (key) DO UPDATE SET
+                    name = excluded.name, price = excluded.price, active = 1
+            ''', [(item['key'], item['name'], item['price']) for item in items])
+
+            keys = [item['key'] for item in items]
+            conn.execute(f'''
+                UPDATE items SET active = 0
+                WHERE key NOT IN ({", ".join("?" * len(keys))})
+            ''', keys)
+
+        conn.close()
+
+    def load_items(self):
+        """Все предметы каталога: (id, key, name, price, active)"""
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute('SELECT id, key, name, price, active FROM items ORDER BY id').fetchall()
+        conn.close()
+        return rows
+
+    def get_last_grant(self, name):
+        """Время (unix) последнего начисления по расписанию или None"""
+        conn = sqlite3.connect(self.db_path)
+        row = conn.execute('SELECT last_run FROM scheduled_grants WHERE name = ?', (name,)).fetchone()
+        conn.close()
+        return row[0] if row else None
+
+    def set_last_grant(self, name, last_run):
+        """Сохранение времени последнего начисления по расписанию"""
+        conn = sqlite3.connect(self.db_path)
+
+        with conn:
+            conn.execute('''
+                INSERT INTO scheduled_grants (name, last_run) VALUES (?, ?)
+                ON CONFLICT (name) DO UPDATE SET last_run = excluded.last_run
+            ''', (name, last_run))
+
+        conn.close()
+
+    def save_trade_bars(self, rows):
+        """Сохранение интервалов статистики сделок сервера, повторные интервалы перезаписываются"""
+        conn = sqlite3.connect(self.db_path)
+
+        with conn:
+            conn.executemany('''
+                INSERT INTO trade_bars (item_id, period_start, node, open, high, low, close,
+                                        volume, trades, buys, turnover, traders)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (item_id, period_start, node) DO UPDATE SET
+                    open = excluded.open, high = excluded.high, low = excluded.low,
+                    close = excluded.close, volume = excluded.volume, trades = excluded.trades,
+                    buys = excluded.buys, turnover = excluded.turnover, traders = excluded.traders
+            ''', rows)
+
+        conn.close()
+
+    def create_indexes(self, conn):
+        """Создание вторичных индексов"""
+        for index_sql in self.INDEXES.values():
+            conn.execute(index_sql)
+
+    def drop_indexes(self, conn):
+        """Удаление вторичных индексов"""
+        for index_name in self.INDEXES:
+            conn.execute(f'DROP INDEX IF EXISTS {index_name}')
+
     def get_account(self, nickname):
         """Получение аккаунта по нику"""
         conn = sqlite3.connect(self.db_path)
@@ -81,8 +316,9 @@ class DatabaseManager:
         if account:
             # получение предметов игрока
             cursor.execute('''
-                SELECT item_id, quantity FROM player_items 
-                WHERE account_id = ?
+                SELECT i.key, p.quantity FROM player_items p
+                JOIN items i ON i.id = p.item_id
+                WHERE p.account_id = ?
             ''', (account[0],))
             items = {item[0]: item[1] for item in cursor.fetchall()}
 
@@ -122,85 +358,204 @@ class DatabaseManager:
         finally:
             conn.close()
 
-    def update_credits(self, account_id, new_credits):
-        """Обновление кредитов аккаунта"""
+    def add_credits(self, account_id, amount):
+        """Относительное изменение кредитов, возвращает новый баланс
+
+        Баланс меняется в БД, а не перезаписывается значением из сессии:
+        начисления других серверов на общей базе не теряются.
+        """
         conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
 
-        cursor.execute('''
-            UPDATE accounts SET credits = ?, last_login = ? 
-            WHERE id = ?
-        ''', (new_credits, datetime.now().isoformat(), account_id))
+        with conn:
+            conn.execute('''
+                UPDATE accounts SET credits = credits + ?, last_login = ?
+                WHERE id = ?
+            ''', (amount, datetime.now().isoformat(), account_id))
+            credits = conn.execute('SELECT credits FROM accounts WHERE id = ?', (account_id,)).fetchone()[0]
 
-        conn.commit()
         conn.close()
+        return credits
 
-    def add_item(self, account_id, item_id):
-        """Добавление предмета игроку"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def trade(self, account_id, item_id, credits_change, quantity_change,
+              request_id=None, fingerprint=None, respond=None):
+        """Сделка одной транзакцией с относительными изменениями
 
-        # проверяем, есть ли уже такой предмет
-        cursor.execute('''
-            SELECT quantity FROM player_items 
-            WHERE account_id = ? AND item_id = ?
-        ''', (account_id, item_id))
+        Возвращает TradeResult или None, если не хватает кредитов или предмета.
+        Проверка идет по БД, а не по сессии. respond(кредиты, количество) строит
+        ответ; с request_id он сохраняется в request_log в той же транзакции, и
+        повтор с любого сервера получает его (replayed), а не новую сделку.
+        """
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
 
-        existing = cursor.fetchone()
+        try:
+            # блокировка записи сразу: проверка request_id и сделка не пересекаются с другими серверами
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = self.trade_in_transaction(conn, account_id, item_id, credits_change, quantity_change,
+                                                   request_id, fingerprint, respond)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        finally:
+            conn.close()
 
-        if existing:
-            # увеличиваем количество
-            cursor.execute('''
-                UPDATE player_items SET quantity = quantity + 1 
-                WHERE account_id = ? AND item_id = ?
-            ''', (account_id, item_id))
-        else:
-            # добавляем новый предмет
-            cursor.execute('''
-                INSERT INTO player_items (account_id, item_id, quantity) 
-                VALUES (?, ?, 1)
+        return result
+
+    def trade_in_transaction(self, conn, account_id, item_id, credits_change, quantity_change,
+                             request_id, fingerprint, respond):
+        now = time.time()
+        if request_id is not None:
+            row = conn.execute('''
+                SELECT fingerprint, response FROM request_log
+                WHERE account_id = ? AND request_id = ? AND created_at >= ?
+            ''', (account_id, request_id, now - GameConfig.DEDUPE_TTL)).fetchone()
+            if row is not None:
+                if row[0] != fingerprint:
+                    response = {'status': 'error', 'message': 'request_id уже использован для другого запроса'}
+                else:
+                    response = dict(json.loads(row[1]), replayed=True)
+                return TradeResult(None, None, response, True)
+
+        if quantity_change < 0:
+            # продажа: сначала списать предмет, если он есть
+            cursor = conn.execute('''
+                UPDATE player_items SET quantity = quantity + ?
+                WHERE account_id = ? AND item_id = ? AND quantity + ? >= 0
+            ''', (quantity_change, account_id, item_id, quantity_change))
+            if cursor.rowcount == 0:
+                return None
+            conn.execute('''
+                DELETE FROM player_items
+                WHERE account_id = ? AND item_id = ? AND quantity <= 0
             ''', (account_id, item_id))
 
-        conn.commit()
-        conn.close()
-
-    def remove_item(self, account_id, item_id):
-        """Удаление предмета у игрока"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        # списание кредитов только при достаточном балансе
+        cursor = conn.execute('''
+            UPDATE accounts SET credits = credits + ?, last_login = ?
+            WHERE id = ? AND credits + ? >= 0
+        ''', (credits_change, datetime.now().isoformat(), account_id, credits_change))
+        if cursor.rowcount == 0:
+            return None
 
-        cursor.execute('''
-            SELECT quantity FROM player_items 
+        if quantity_change > 0:
+            cursor = conn.execute('''
+                UPDATE player_items SET quantity = quantity + ?
+                WHERE account_id = ? AND item_id = ?
+            ''', (quantity_change, account_id, item_id))
+            if cursor.rowcount == 0:
+                conn.execute('''
+                    INSERT INTO player_items (account_id, item_id, quantity)
+                    VALUES (?, ?, ?)
+                ''', (account_id, item_id, quantity_change))
+
+        credits = conn.execute('SELECT credits FROM accounts WHERE id = ?', (account_id,)).fetchone()[0]
+        quantity = conn.execute('''
+            SELECT COALESCE(SUM(quantity), 0) FROM player_items
             WHERE account_id = ? AND item_id = ?
-        ''', (account_id, item_id))
+        ''', (account_id, item_id)).fetchone()[0]
 
-        existing = cursor.fetchone()
+        response = respond(credits, quantity) if respond is not None else None
+        if request_id is not None:
+            # устаревшие ответы игрока удаляем здесь же, таблица не растет
+            conn.execute('''
+                DELETE FROM request_log WHERE account_id = ? AND created_at < ?
+            ''', (account_id, now - GameConfig.DEDUPE_TTL))
+            conn.execute('''
+                INSERT OR REPLACE INTO request_log (account_id, request_id, fingerprint, response, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (account_id, request_id, fingerprint, json.dumps(response, ensure_ascii=False), now))
 
-        if existing and existing[0] > 1:
-            # уменьшить количество
-            cursor.execute('''
-                UPDATE player_items SET quantity = quantity - 1 
-                WHERE account_id = ? AND item_id = ?
-            ''', (account_id, item_id))
-        elif existing:
-            # удаление предмета
-            cursor.execute('''
-                DELETE FROM player_items 
-                WHERE account_id = ? AND item_id = ?
-            ''', (account_id, item_id))
-
-        conn.commit()
-        conn.close()
+        return TradeResult(credits, quantity, response, False)
 
 
 class GameServer:
     """Основной класс игрового сервера"""
 
-    def __init__(self, host='localhost', port=12345):
+    def __init__(self, host='localhost', port=12345, db_path='game_database.db', ready_file=None,
+                 bonus_scheduler=False):
         self.host = host
         self.port = port
-        self.db_manager = DatabaseManager()
+        self.ready_file = ready_file
+        self.bonus_scheduler = bonus_scheduler
+        self.ready = False
+        self.started_at = None
+        self.startup = None
+
+        db_started = time.perf_counter()
+        self.db_manager = DatabaseManager(db_path)
         self.active_sessions = {}
+        # изменения сессий и стоимости инвентарей, в том числе при смене цен каталога
+        self.sessions_lock = threading.RLock()
+        self.catalog_lock = threading.Lock()
+        self.catalog = None
+        self.reload_items()
+        self.db_init_seconds = time.perf_counter() - db_started
+
+        self.profiler = RequestProfiler(self)
+        self.analytics = TradeAnalytics()
+        # процесс сервера: у каждого сервера за шлюзом свои строки в trade_bars
+        node = f'{socket.gethostname()}/{os.getpid()}'
+        self.trade_rollup = TradeRollup(self.analytics, self.db_manager, GameConfig.TRADE_ROLLUP_SECONDS, node)
+
+        self.registry = self.build_registry()
+        self.rate_limiter = RateLimiter(*GameConfig.RATE_LIMIT) if GameConfig.RATE_LIMIT else None
+        self.dedupe = DedupeCache(GameConfig.DEDUPE_TTL, GameConfig.DEDUPE_MAX_PER_ACCOUNT)
+        self.stage_timings = StageTimings()
+        stages = [('auth', self.auth_stage), ('idempotency', self.idempotency_stage),
+                  ('validation', self.validation_stage), ('analytics', self.analytics_stage)]
+        if self.rate_limiter is not None:
+            stages.insert(0, ('rate_limit', self.rate_limit_stage))
+        self.pipeline = build_pipeline(stages, self.handler_stage, self.stage_timings)
+
+    def build_registry(self):
+        """Действия сервера: обработчик, схема параметров, требования доступа"""
+        registry = ActionRegistry()
+        nickname = {'nickname': Field(str)}
+        item = {'item_id': Field(str)}
+
+        registry.register('login', self.handle_login, schema=nickname, idempotent=True)
+        registry.register('logout', self.handle_logout)
+        registry.register('get_items', self.handle_get_items)
+        registry.register('get_trade_stats', self.handle_get_trade_stats, schema={
+            'window': Field(str, required=False, choices=tuple(WINDOWS)),
+            'item_id': Field(str, required=False),
+        })
+        registry.register('health', self.handle_health)
+        registry.register('buy_item', self.handle_buy_item, schema=item, auth=True, item=True, idempotent=True)
+        registry.register('sell_item', self.handle_sell_item, schema=item, auth=True, item=True, idempotent=True)
+        registry.register('get_account_info', self.handle_get_account_info, auth=True)
+        registry.register('get_inventory', self.handle_get_inventory, auth=True, schema={
+            'sort': Field(str, required=False, choices=('item_id', 'quantity', 'value')),
+            'order': Field(str, required=False, choices=('asc', 'desc')),
+            'limit': Field(int, required=False),
+            'cursor': Field(list, required=False),
+            'min_quantity': Field(int, required=False),
+            'query': Field(str, required=False),
+        })
+
+        # служебные действия
+        registry.register('profile_start', self.handle_profile_start, admin=True, schema={
+            'requests': Field(int, required=False),
+            'seconds': Field((int, float), required=False),
+        })
+        registry.register('profile_stop', self.handle_profile_stop, admin=True)
+        registry.register('memory_snapshot', self.handle_memory_snapshot, admin=True, schema={
+            'top': Field(int, required=False),
+            'stop': Field(bool, required=False),
+        })
+        registry.register('reload_items', self.handle_reload_items, admin=True)
+        registry.register('attach_session', self.handle_attach_session, admin=True, schema=nickname)
+        registry.register('grant_bonus', self.handle_grant_bonus, admin=True, schema={
+            'credits': Field(int, required=False),
+            'item_id': Field(str, required=False),
+            'quantity': Field(int, required=False),
+            'segment': Field(dict, required=False),
+        })
+        registry.register('get_stage_timings', self.handle_get_stage_timings, admin=True, schema={
+            'reset': Field(bool, required=False),
+        })
+        return registry
 
     def start(self):
         """Запуск сервера"""
@@ -210,6 +565,13 @@ class GameServer:
         try:
             server_socket.bind((self.host, self.port))
             server_socket.listen(5)
+            # при port=0 система выбирает свободный порт
+            self.port = server_socket.getsockname()[1]
+            self.install_signal_handlers()
+            if GameConfig.SCHEDULED_BONUS and self.bonus_scheduler:
+                BonusScheduler(self, **GameConfig.SCHEDULED_BONUS).start()
+            self.trade_rollup.start()
+            self.signal_ready()
             logger.info(f"Сервер запущен на {self.host}:{self.port}")
             print(f"Игровой сервер запущен на {self.host}:{self.port}")
             print("Ожидание подключения клиентов")
@@ -234,7 +596,7 @@ class GameServer:
                     continue
 
         except OSError as e:
-            if e.errno == 10048:
+            if e.errno in (errno.EADDRINUSE, 10048):
                 print(f"Ошибка: порт {self.port} уже используется")
                 print("Возможно, сервер уже запущен или порт занят другим приложением")
             else:
@@ -244,8 +606,70 @@ class GameServer:
             print("\nОстановка сервера")
         finally:
             server_socket.close()
+            self.ready = False
+            self.trade_rollup.stop()
+            self.trade_rollup.flush()
+            if self.ready_file and os.path.exists(self.ready_file):
+                os.remove(self.ready_file)
             logger.info("Сервер остановлен")
 
+    def startup_timings(self):
+        """Время холодного старта в миллисекундах"""
+        return {
+            'import_ms': round(IMPORT_SECONDS * 1000, 1),
+            'db_init_ms': round(self.db_init_seconds * 1000, 1),
+            'total_ms': round((time.perf_counter() - STARTED_AT) * 1000, 1)
+        }
+
+    def signal_ready(self):
+        """Сигнал готовности: БД инициализирована, сокет слушает"""
+        self.ready = True
+        self.started_at = time.monotonic()
+        self.startup = timings = self.startup_timings()
+        logger.info(f"Сервер готов за {timings['total_ms']} мс "
+                    f"(импорт {timings['import_ms']} мс, БД {timings['db_init_ms']} мс)")
+
+        if self.ready_file:
+            # запись через временный файл: ожидающий процесс не увидит его недописанным
+            tmp_path = f'{self.ready_file}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'pid': os.getpid(), 'host': self.host, 'port': self.port, **timings}, f)
+            os.replace(tmp_path, self.ready_file)
+
+    def install_signal_handlers(self):
+        """SIGTERM - штатная остановка, SIGUSR1 - cProfile, SIGUSR2 - снимок памяти"""
+        if threading.current_thread() is not threading.main_thread():
+            return
+
+        # при остановке лаунчером тоже удаляем файл готовности
+        signal.signal(signal.SIGTERM, self.on_terminate_signal)
+
+        if not hasattr(signal, 'SIGUSR1'):
+            return
+
+        signal.signal(signal.SIGUSR1, self.on_profile_signal)
+        signal.signal(signal.SIGUSR2, self.on_memory_signal)
+
+    def on_terminate_signal(self, signum, frame):
+        """Остановка по SIGTERM"""
+        raise SystemExit(0)
+
+    def on_profile_signal(self, signum, frame):
+        """Переключение профилирования по сигналу"""
+        if self.profiler.active:
+            # сохранение профилей не должно выполняться внутри обработчика сигнала
+            threading.Thread(target=self.profiler.stop, daemon=True).start()
+        else:
+            self.profiler.start(seconds=GameConfig.PROFILE_SIGNAL_SECONDS)
+
+    def on_memory_signal(self, signum, frame):
+        """Снимок памяти по сигналу, разница пишется в лог"""
+        def take_snapshot():
+            for line in self.profiler.memory_snapshot():
+                logger.info(f"tracemalloc: {line}")
+
+        threading.Thread(target=take_snapshot, daemon=True).start()
+
     def handle_client(self, client_socket, addr):
         """Обработка клиента"""
         try:
@@ -273,44 +697,102 @@ class GameServer:
     def process_request(self, request):
         """Обработка запроса от клиента"""
         action = request.get('action')
-
-        if action == 'login':
-            return self.handle_login(request)
-        elif action == 'logout':
-            return self.handle_logout(request)
-        elif action == 'get_items':
-            return self.handle_get_items(request)
-        elif action == 'buy_item':
-            return self.handle_buy_item(request)
-        elif action == 'sell_item':
-            return self.handle_sell_item(request)
-        elif action == 'get_account_info':
-            return self.handle_get_account_info(request)
-        else:
+        spec = self.registry.get(action)
+        if spec is None:
             return {'status': 'error', 'message': f'Неизвестное действие: {action}'}
 
-    def handle_login(self, request):
+        return self.pipeline(RequestContext(action, request, spec))
+
+    def rate_limit_stage(self, ctx, call_next):
+        """Ограничение частоты запросов игрока"""
+        nickname = ctx.request.get('nickname')
+        if isinstance(nickname, str) and not self.rate_limiter.allow(nickname):
+            return {'status': 'error', 'message': 'Слишком много запросов'}
+        return call_next(ctx)
+
+    def auth_stage(self, ctx, call_next):
+        """Проверка сессии игрока или токена служебных действий"""
+        spec = ctx.spec
+        if spec.admin and not check_admin_token(ctx.request):
+            return {'status': 'error', 'message': 'Нет доступа'}
+
+        if spec.auth:
+            nickname = ctx.request.get('nickname')
+            ctx.account = self.active_sessions.get(nickname) if isinstance(nickname, str) else None
+            if ctx.account is None:
+                return {'status': 'error', 'message': 'Не авторизован'}
+
+        return call_next(ctx)
+
+    def idempotency_stage(self, ctx, call_next):
+        """Повтор запроса с тем же request_id получает сохраненный ответ, а не выполняется заново"""
+        request_id = ctx.request.get('request_id')
+        nickname = ctx.request.get('nickname')
+        if request_id is None or not ctx.spec.idempotent or not isinstance(nickname, str):
+            return call_next(ctx)
+
+        if not isinstance(request_id, str) or not 0 < len(request_id) <= 64:
+            return {'status': 'error', 'message': 'Неверный параметр request_id'}
+
+        fingerprint = (ctx.action, ctx.request.get('item_id'))
+        entry, response = self.dedupe.begin(nickname, request_id, fingerprint)
+        if entry is None:
+            logger.info(f"Повтор запроса {request_id} игрока {nickname}, возвращен сохраненный ответ")
+            return response
+
+        response = None
+        try:
+            response = call_next(ctx)
+        finally:
+            self.dedupe.finish(nickname, request_id, entry, response)
+        return response
+
+    def validation_stage(self, ctx, call_next):
+        """Проверка параметров по схеме действия и предмета по каталогу"""
+        spec = ctx.spec
+        if spec.validate is not None:
+            error = spec.validate(ctx.request)
+            if error:
+                return {'status': 'error', 'message': error}
+
+        if spec.item:
+            ctx.item = self.catalog.get(ctx.request.get('item_id'))
+            if ctx.item is None:
+                return {'status': 'error', 'message': 'Неизвестный предмет'}
+
+        return call_next(ctx)
+
+    def analytics_stage(self, ctx, call_next):
+        """Учет совершенных сделок в статистике рынка"""
+        response = call_next(ctx)
+        if ctx.trade is not None:
+            item, price, buy = ctx.trade
+            self.analytics.record(item, price, buy, ctx.account['id'])
+        return response
+
+    def handler_stage(self, ctx):
+        """Вызов обработчика действия"""
+        return ctx.spec.handler(ctx)
+
+    def handle_login(self, ctx):
         """Обработка логина"""
-        nickname = request.get('nickname')
-        if not nickname:
-            return {'status': 'error', 'message': 'Не указан nickname'}
+        nickname = ctx.request['nickname']
 
-        # получить или создать аккаунт
-        account = self.db_manager.get_account(nickname)
-        if not account:
-            account = self.db_manager.create_account(nickname)
+        # чтение и запись кредитов под блокировкой сессий, чтобы не потерять массовый бонус
+        with self.sessions_lock:
+            # получить или создать аккаунт
+            account = self.db_manager.get_account(nickname)
             if not account:
-                return {'status': 'error', 'message': 'Не удалось создать аккаунт'}
-
-        # начисление кредитов за взод в игру
-        login_bonus = random.randint(*GameConfig.CREDITS_RANGE)
-        new_credits = account['credits'] + login_bonus
+                account = self.db_manager.create_account(nickname)
+                if not account:
+                    return {'status': 'error', 'message': 'Не удалось создать аккаунт'}
 
-        self.db_manager.update_credits(account['id'], new_credits)
-        account['credits'] = new_credits
+            # начисление кредитов за взод в игру
+            login_bonus = random.randint(*GameConfig.CREDITS_RANGE)
+            account['credits'] = self.db_manager.add_credits(account['id'], login_bonus)
 
-        # Сохраняем сессию
-        self.active_sessions[nickname] = account
+            # Сохраняем сессию
+            self.open_session(account)
 
         logger.info(f"Игрок {nickname} вошел в игру. Бонус: {login_bonus} кредитов")
 
@@ -319,122 +801,362 @@ class GameServer:
             'account': {
                 'nickname': account['nickname'],
                 'credits': account['credits'],
-                'items': account['items']
+                'items': account['items'],
+                'inventory_value': account['inventory_value']
             },
             'login_bonus': login_bonus,
-            'available_items': GameConfig.ITEMS
+            'available_items': self.catalog.public
         }
 
-    def handle_logout(self, request):
+    def open_session(self, account):
+        """Сохранение сессии: стоимость инвентаря считается один раз, дальше только изменяется"""
+        with self.sessions_lock:
+            catalog = self.catalog
+            account['inventory_value'] = sum(
+                quantity * self.item_price(catalog, item_id)
+                for item_id, quantity in account['items'].items()
+            )
+            self.active_sessions[account['nickname']] = account
+
+    @staticmethod
+    def item_price(catalog, item_id):
+        """Цена предмета для оценки инвентаря, снятые с продажи предметы стоят 0"""
+        item = catalog.get(item_id)
+        return item.price if item else 0
+
+    def handle_logout(self, ctx):
         """Обработка выхода"""
-        nickname = request.get('nickname')
-        if nickname in self.active_sessions:
-            del self.active_sessions[nickname]
+        nickname = ctx.request.get('nickname')
+        with self.sessions_lock:
+            account = self.active_sessions.pop(nickname, None) if isinstance(nickname, str) else None
+        if account:
             logger.info(f"Игрок {nickname} вышел из игры")
 
         return {'status': 'success', 'message': 'Выход выполнен'}
 
-    def handle_get_items(self, request):
+    def handle_get_items(self, ctx):
         """Получение списка всех доступных предметов"""
         return {
             'status': 'success',
-            'items': GameConfig.ITEMS
+            'items': self.catalog.public
+        }
+
+    def handle_get_trade_stats(self, ctx):
+        """Статистика сделок по предметам за окно 1m, 5m или 1h"""
+        window = ctx.request.get('window') or '5m'
+        stats = self.analytics.stats(window, ctx.request.get('item_id'))
+        return {'status': 'success', 'window': window, 'items': stats}
+
+    def handle_health(self, ctx):
+        """Проверка готовности сервера"""
+        return {
+            'status': 'success',
+            'ready': self.ready,
+            'uptime': round(time.monotonic() - self.started_at, 3) if self.ready else 0,
+            'sessions': len(self.active_sessions),
+            'catalog_version': self.catalog.version,
+            'startup': self.startup
         }
 
-    def handle_buy_item(self, request):
+    def handle_buy_item(self, ctx):
         """Покупка предмета"""
-        nickname = request.get('nickname')
-        item_id = request.get('item_id')
+        account = ctx.account
+        nickname = account['nickname']
+        item_id = ctx.item.key
+
+        with self.sessions_lock:
+            # сессия могла закрыться или смениться повторным входом после проверки в auth
+            if self.active_sessions.get(nickname) is not account:
+                return {'status': 'error', 'message': 'Не авторизован'}
+
+            # один снимок каталога на всю сделку; каталог мог смениться после проверки
+            item = self.catalog.get(item_id)
+            if item is None:
+                return {'status': 'error', 'message': 'Неизвестный предмет'}
+
+            item_price = item.price
+            message = f'Предмет {item.name} куплен'
+
+            # купить предмет: баланс проверяется и меняется в БД
+            result = self.db_manager.trade(
+                account['id'], item.id, -item_price, 1,
+                ctx.request.get('request_id'), f'{ctx.action}:{item_id}',
+                lambda credits, quantity: self.trade_response(message, account, item, credits, quantity))
+            if result is None:
+                return {'status': 'error', 'message': 'Недостаточно кредитов'}
+            if result.replayed:
+                # сделку уже выполнил этот или другой сервер, сессия загружена из БД после нее
+                return result.response
+
+            # обнова сес: значения из БД учитывают начисления других серверов
+            self.apply_trade(account, item, result.credits, result.quantity)
+
+        ctx.trade = (item, item_price, True)
+        logger.info(f"Игрок {nickname} купил {item_id} за {item_price} кредитов")
+        return result.response
 
-        if nickname not in self.active_sessions:
-            return {'status': 'error', 'message': 'Не авторизован'}
+    def handle_sell_item(self, ctx):
+        """Продажа предмета"""
+        account = ctx.account
+        nickname = account['nickname']
+        item_id = ctx.item.key
+
+        with self.sessions_lock:
+            # сессия могла закрыться или смениться повторным входом после проверки в auth
+            if self.active_sessions.get(nickname) is not account:
+                return {'status': 'error', 'message': 'Не авторизован'}
+
+            # один снимок каталога на всю сделку; каталог мог смениться после проверки
+            item = self.catalog.get(item_id)
+            if item is None:
+                return {'status': 'error', 'message': 'Неизвестный предмет'}
+
+            # Продаем предмет за половину цены
+            item_price = item.price // 2
+
+            message = f'Предмет {item.name} продан за {item_price} кредитов'
+
+            result = self.db_manager.trade(
+                account['id'], item.id, item_price, -1,
+                ctx.request.get('request_id'), f'{ctx.action}:{item_id}',
+                lambda credits, quantity: self.trade_response(message, account, item, credits, quantity))
+            if result is None:
+                return {'status': 'error', 'message': 'У вас нет этого предмета. Факир был пьян ( '}
+            if result.replayed:
+                return result.response
+
+            # обнова сессии
+            self.apply_trade(account, item, result.credits, result.quantity)
+
+        ctx.trade = (item, item_price, False)
+        logger.info(f"Игрок {nickname} продал {item_id} за {item_price} кредитов")
+        return result.response
 
-        if item_id not in GameConfig.ITEMS:
-            return {'status': 'error', 'message': 'Неизвестный предмет'}
+    @staticmethod
+    def trade_response(message, account, item, credits, quantity):
+        """Ответ на сделку: только изменения, а не весь инвентарь; сессия еще не обновлена"""
+        return {
+            'status': 'success',
+            'message': message,
+            'new_credits': credits,
+            'item_id': item.key,
+            'quantity': quantity,
+            'inventory_value': account['inventory_value'] + (quantity - account['items'].get(item.key, 0)) * item.price
+        }
 
-        account = self.active_sessions[nickname]
-        item_price = GameConfig.ITEMS[item_id]['price']
+    @staticmethod
+    def apply_trade(account, item, credits, quantity):
+        """Перенос результата сделки из БД в сессию с пересчетом стоимости инвентаря"""
+        account['credits'] = credits
+        account['inventory_value'] += (quantity - account['items'].get(item.key, 0)) * item.price
+        if quantity > 0:
+            account['items'][item.key] = quantity
+        else:
+            account['items'].pop(item.key, None)
 
-        if account['credits'] < item_price:
-            return {'status': 'error', 'message': 'Недостаточно кредитов'}
+    def handle_get_account_info(self, ctx):
+        """Получение информации об аккаунте"""
+        account = ctx.account
+        return {
+            'status': 'success',
+            'account': {
+                'nickname': account['nickname'],
+                'credits': account['credits'],
+                'item_count': len(account['items']),
+                'inventory_value': account['inventory_value']
+            }
+        }
 
-        # купить предмет
-        new_credits = account['credits'] - item_price
-        self.db_manager.update_credits(account['id'], new_credits)
-        self.db_manager.add_item(account['id'], item_id)
+    def handle_get_inventory(self, ctx):
+        """Страница инвентаря с фильтром, сортировкой и курсором"""
+        # типы и допустимые значения параметров проверены по схеме действия
+        request = ctx.request
+        sort = request.get('sort') or 'item_id'
+        order = request.get('order') or 'asc'
+        limit = request.get('limit') or GameConfig.INVENTORY_PAGE_SIZE
+        cursor = request.get('cursor')
+        min_quantity = request.get('min_quantity') or 0
+        query = request.get('query')
+
+        if not 0 < limit <= GameConfig.INVENTORY_MAX_PAGE_SIZE:
+            return {'status': 'error', 'message': 'Неверный размер страницы'}
+        if cursor is not None and len(cursor) != 2:
+            return {'status': 'error', 'message': 'Неверный курсор'}
+
+        catalog = self.catalog
+        account = ctx.account
+        with self.sessions_lock:
+            items = list(account['items'].items())
+            inventory_value = account['inventory_value']
+
+        # ключ сортировки (значение, item_id) уникален, он же служит курсором
+        value_type = str if sort == 'item_id' else int
+        if cursor is not None:
+            if not isinstance(cursor[0], value_type) or not isinstance(cursor[1], str):
+                return {'status': 'error', 'message': 'Неверный курсор'}
+            cursor = tuple(cursor)
+
+        descending = order == 'desc'
+        query = query.lower() if query else None
+        rows = []
+        for item_id, quantity in items:
+            if quantity < min_quantity:
+                continue
+
+            item = catalog.get(item_id)
+            name = item.name if item else item_id
+            if query and query not in item_id.lower() and query not in name.lower():
+                continue
+
+            price = item.price if item else 0
+            if sort == 'item_id':
+                key = (item_id, item_id)
+            elif sort == 'quantity':
+                key = (quantity, item_id)
+            else:
+                key = (quantity * price, item_id)
 
-        # обнова сес
-        account['credits'] = new_credits
-        if item_id in account['items']:
-            account['items'][item_id] += 1
-        else:
-            account['items'][item_id] = 1
+            if cursor is not None and (key >= cursor if descending else key <= cursor):
+                continue
+            rows.append((key, item_id, name, quantity, price))
 
-        logger.info(f"Игрок {nickname} купил {item_id} за {item_price} кредитов")
+        page = (heapq.nlargest if descending else heapq.nsmallest)(limit, rows)
 
         return {
             'status': 'success',
-            'message': f'Предмет {GameConfig.ITEMS[item_id]["name"]} куплен',
-            'new_credits': new_credits,
-            'items': account['items']
+            'items': [
+                {'item_id': item_id, 'name': name, 'quantity': quantity,
+                 'price': price, 'value': quantity * price}
+                for _, item_id, name, quantity, price in page
+            ],
+            'next_cursor': list(page[-1][0]) if len(rows) > limit else None,
+            'inventory_value': inventory_value
         }
 
-    def handle_sell_item(self, request):
-        """Продажа предмета"""
-        nickname = request.get('nickname')
-        item_id = request.get('item_id')
+    def reload_items(self):
+        """Загрузка каталога из файла в БД и атомарная замена снимка каталога"""
+        with self.catalog_lock:
+            items = load_catalog_file(GameConfig.ITEMS_FILE)
+            self.db_manager.sync_items(items)
+
+            version = self.catalog.version + 1 if self.catalog else 1
+            catalog = ItemCatalog(self.db_manager.load_items(), version)
+
+            with self.sessions_lock:
+                # замена ссылки атомарна: запросы в процессе обработки дорабатывают со старым снимком
+                old_catalog, self.catalog = self.catalog, catalog
+                if old_catalog is not None:
+                    self.revalue_sessions(old_catalog, catalog)
+
+        logger.info(f"Каталог предметов загружен: версия {version}, предметов {len(catalog)}")
+        return catalog
+
+    def revalue_sessions(self, old_catalog, catalog):
+        """Поправка стоимости инвентарей только по предметам, у которых изменилась цена"""
+        deltas = {}
+        for item_id in set(old_catalog.by_key) | set(catalog.by_key):
+            delta = self.item_price(catalog, item_id) - self.item_price(old_catalog, item_id)
+            if delta:
+                deltas[item_id] = delta
+
+        if not deltas:
+            return
+
+        for account in self.active_sessions.values():
+            items = account['items']
+            for item_id, delta in deltas.items():
+                quantity = items.get(item_id)
+                if quantity:
+                    account['inventory_value'] += quantity * delta
+
+    def handle_reload_items(self, ctx):
+        """Горячая перезагрузка каталога предметов"""
+        try:
+            catalog = self.reload_items()
+        except (OSError, CatalogError) as e:
+            logger.error(f"Ошибка загрузки каталога: {e}")
+            return {'status': 'error', 'message': f'Ошибка загрузки каталога: {e}'}
 
-        if nickname not in self.active_sessions:
-            return {'status': 'error', 'message': 'Не авторизован'}
+        return {'status': 'success', 'version': catalog.version, 'items': catalog.public}
 
-        if item_id not in GameConfig.ITEMS:
-            return {'status': 'error', 'message': 'Неизвестный предмет'}
+    def handle_attach_session(self, ctx):
+        """Открытие сессии без бонуса за вход (перенос игрока с другого сервера)"""
+        nickname = ctx.request['nickname']
+        account = self.db_manager.get_account(nickname)
+        if not account:
+            return {'status': 'error', 'message': 'Аккаунт не найден'}
+
+        self.open_session(account)
+        logger.info(f"Сессия игрока {nickname} перенесена на этот сервер")
+        return {'status': 'success'}
+
+    def grant_bonus(self, credits=0, item_id=None, quantity=1, segment=None):
+        """Массовое начисление бонуса с согласованным обновлением открытых сессий"""
+        item = None
+        if item_id is not None:
+            item = self.catalog.get(item_id)
+            if item is None:
+                raise ValueError('Неизвестный предмет')
+
+        return grant_bonus(self.db_manager, credits, item, quantity, segment,
+                           sessions=self.active_sessions, lock=self.sessions_lock)
+
+    def handle_grant_bonus(self, ctx):
+        """Начисление кредитов или предмета всем аккаунтам сегмента"""
+        request = ctx.request
+        credits = request.get('credits') or 0
+        quantity = request.get('quantity') or 1
+        segment = request.get('segment')
+        if credits < 0 or quantity <= 0:
+            return {'status': 'error', 'message': 'Неверные параметры бонуса'}
 
-        account = self.active_sessions[nickname]
+        try:
+            result = self.grant_bonus(credits, request.get('item_id'), quantity, segment)
+        except ValueError as e:
+            return {'status': 'error', 'message': str(e)}
 
-        if item_id not in account['items'] or account['items'][item_id] <= 0:
-            return {'status': 'error', 'message': 'У вас нет этого предмета. Факир был пьян ( '}
+        return {'status': 'success', **result}
 
-        # Продаем предмет за половину цены
-        item_price = GameConfig.ITEMS[item_id]['price'] // 2
-        new_credits = account['credits'] + item_price
+    def handle_profile_start(self, ctx):
+        """Включение профилирования на N запросов или T секунд"""
+        requests = ctx.request.get('requests')
+        seconds = ctx.request.get('seconds')
+        if requests is None and seconds is None:
+            return {'status': 'error', 'message': 'Укажите requests или seconds'}
 
-        self.db_manager.update_credits(account['id'], new_credits)
-        self.db_manager.remove_item(account['id'], item_id)
+        for value in (requests, seconds):
+            if value is not None and value <= 0:
+                return {'status': 'error', 'message': 'Неверные параметры профилирования'}
 
-        # обнова сессии
-        account['credits'] = new_credits
-        account['items'][item_id] -= 1
-        if account['items'][item_id] <= 0:
-            del account['items'][item_id]
+        if not self.profiler.start(requests=requests, seconds=seconds):
+            return {'status': 'error', 'message': 'Профилирование уже включено'}
 
-        logger.info(f"Игрок {nickname} продал {item_id} за {item_price} кредитов")
+        return {'status': 'success', 'profiler': self.profiler.status()}
 
-        return {
-            'status': 'success',
-            'message': f'Предмет {GameConfig.ITEMS[item_id]["name"]} продан за {item_price} кредитов',
-            'new_credits': new_credits,
-            'items': account['items']
-        }
+    def handle_profile_stop(self, ctx):
+        """Выключение профилирования и сохранение pstats"""
+        return {'status': 'success', 'files': self.profiler.stop()}
 
-    def handle_get_account_info(self, request):
-        """Получение информации об аккаунте"""
-        nickname = request.get('nickname')
-
-        if nickname not in self.active_sessions:
-            return {'status': 'error', 'message': 'Не авторизован'}
+    def handle_memory_snapshot(self, ctx):
+        """Снимок tracemalloc и разница с предыдущим снимком"""
+        top = ctx.request.get('top') or 10
+        diff = self.profiler.memory_snapshot(top=top, stop=ctx.request.get('stop', False))
+        return {'status': 'success', 'top_allocations': diff}
 
-        account = self.active_sessions[nickname]
-        return {
-            'status': 'success',
-            'account': {
-                'nickname': account['nickname'],
-                'credits': account['credits'],
-                'items': account['items']
-            }
-        }
+    def handle_get_stage_timings(self, ctx):
+        """Собственное время этапов конвейера обработки запросов"""
+        return {'status': 'success', 'stages': self.stage_timings.snapshot(reset=ctx.request.get('reset', False))}
 
 
 if __name__ == '__main__':
-    server = GameServer()
+    parser = argparse.ArgumentParser(description='Игровой сервер')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=12345)
+    parser.add_argument('--db', default='game_database.db', help='путь к базе данных')
+    parser.add_argument('--ready-file', help='файл, который создается, когда сервер готов принимать клиентов')
+    parser.add_argument('--bonus-scheduler', action='store_true',
+                        help='начислять GameConfig.SCHEDULED_BONUS (только на одном сервере общей базы)')
+    args = parser.parse_args()
+
+    server = GameServer(args.host, args.port, args.db, args.ready_file, args.bonus_scheduler)
     server.start()
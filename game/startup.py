@@ -0,0 +1,48 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def new_ready_file():
+    """Путь к файлу готовности для нового процесса сервера"""
+    fd, path = tempfile.mkstemp(prefix='game_server_', suffix='.ready')
+    os.close(fd)
+    # сервер создаст файл заново, когда будет готов
+    os.remove(path)
+    return path
+
+
+def start_server_process(script='server.py', args=(), ready_file=None, new_console=True, quiet=False):
+    """Запуск server.py в отдельном процессе, на Windows - в новом окне"""
+    command = [sys.executable, script, *args]
+    if ready_file:
+        command += ['--ready-file', ready_file]
+
+    if quiet:
+        return subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if os.name == 'nt' and new_console:
+        return subprocess.Popen(command, creationflags=subprocess.CREATE_NEW_CONSOLE)
+    return subprocess.Popen(command)
+
+
+def wait_until_ready(ready_file, process=None, timeout=10, interval=0.01):
+    """Ожидание файла готовности сервера, возвращает его содержимое или None
+
+    Ожидание прерывается сразу, если процесс сервера завершился.
+    """
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        if os.path.exists(ready_file):
+            with open(ready_file, encoding='utf-8') as f:
+                return json.load(f)
+
+        if process is not None and process.poll() is not None:
+            return None
+
+        time.sleep(interval)
+
+    return None